@@ -0,0 +1,45 @@
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+from configuration import Configuration
+
+# "budget" limits the spending of a wallet in a calendar month, and "imbalance" the debt of its debtor
+ALERT_TYPES = ('budget', 'imbalance')
+
+
+class AlertRule(NamedTuple):
+    wallet: str
+    type: str
+    limit: float
+
+
+class Alert(NamedTuple):
+    rule: AlertRule
+    value: float
+
+
+class AlertRules:
+    """The configured alert rules, grouped by wallet so that a payment is only checked against the rules of its wallet.
+
+    A rule fires when a payment takes its value over the limit, and not again for the payments keeping it over.
+    """
+
+    def __init__(self, rules: Iterable[AlertRule]):
+        self._rules: Dict[str, List[AlertRule]] = {}
+        for rule in rules:
+            self._rules.setdefault(rule.wallet, []).append(rule)
+
+    @staticmethod
+    def from_configuration(configuration: Configuration) -> 'AlertRules':
+        return AlertRules(AlertRule(rule['wallet'], rule['type'], rule['limit']) for rule in configuration.get_alerts())
+
+    def __contains__(self, wallet: str):
+        return wallet in self._rules
+
+    def evaluate(self, wallet: str, spending: Tuple[float, float], debt: Tuple[float, float]) -> List[Alert]:
+        """Returns the alerts fired by a payment, given the monthly spending and the debt before and after it."""
+        alerts = []
+        for rule in self._rules.get(wallet, ()):
+            before, after = spending if rule.type == 'budget' else debt
+            if before <= rule.limit < after:
+                alerts.append(Alert(rule, round(after, 2)))
+        return alerts
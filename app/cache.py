@@ -0,0 +1,53 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, TypeVar
+
+V = TypeVar('V')
+
+
+class LRUCache:
+    """Bounded mapping which evicts the least recently used entry once it is full, and counts its hits, misses and
+    evictions.
+
+    It can be shared by threads. The factory of a missing entry runs outside of the lock, so that a slow one does not
+    hold up the hits.
+    """
+
+    def __init__(self, maxsize: int):
+        if maxsize <= 0:
+            raise ValueError(f'Invalid cache size: {maxsize}')
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get_or_set(self, key: Hashable, factory: Callable[[], V]) -> V:
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+        value = factory()
+        with self._lock:
+            self._entries[key] = value
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable):
+        return key in self._entries
+
+    def get_stats(self) -> Dict[str, int]:
+        return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
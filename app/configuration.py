@@ -1,5 +1,8 @@
 import json
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+# Languages in which the amounts of these wallets are spelled out when their "words" are not configured
+DEFAULT_WALLET_WORDS = {'Toman': 'fa'}
 
 
 class Configuration:
@@ -31,6 +34,69 @@ class Configuration:
                 raise ConfigurationError('Type of the configured usernames is not str')
             if type(self._user1['chat_id']) != int or type(self._user2['chat_id']) != int:
                 raise ConfigurationError('Type of the configured chat IDs is not int')
+            for user in self._users:
+                if type(user.get('language', 'en')) != str:
+                    raise ConfigurationError('Type of the configured languages is not str')
+            for wallet in self._wallets:
+                if wallet.get('words') is not None and type(wallet['words']) != str:
+                    raise ConfigurationError('Type of the configured "words" languages is not str')
+
+            # Validate and initialize the optional database maintenance settings
+            self._maintenance = {'interval_hours': 24, 'backups': 7, 'archive_after_years': None}
+            maintenance = data.get('maintenance', {})
+            for key, value in maintenance.items():
+                if key not in self._maintenance:
+                    raise ConfigurationError(f'Configuration error: unknown maintenance setting "{key}".')
+                if key == 'backups':
+                    # A number of files, unlike the interval and the age
+                    if type(value) != int or value <= 0:
+                        raise ConfigurationError('Configuration error: maintenance setting "backups" must be a positive integer.')
+                elif value is not None and (type(value) not in (int, float) or value <= 0):
+                    raise ConfigurationError(f'Configuration error: maintenance setting "{key}" must be a positive number.')
+            self._maintenance.update(maintenance)
+
+            # Validate and initialize the optional rate limit settings. Every user can spend "capacity" tokens at once,
+            # refilled at "refill_per_second", and a command costs 1 token unless configured otherwise
+            self._rate_limit = {'capacity': 20, 'refill_per_second': 0.5, 'costs': {'history': 10, 'status': 0.5}}
+            rate_limit = dict(data.get('rate_limit', {}))
+            costs = rate_limit.pop('costs', {})
+            for key, value in rate_limit.items():
+                if key not in self._rate_limit:
+                    raise ConfigurationError(f'Configuration error: unknown rate limit setting "{key}".')
+                if type(value) not in (int, float) or value <= 0:
+                    raise ConfigurationError(f'Configuration error: rate limit setting "{key}" must be a positive number.')
+            if type(costs) != dict or any(type(v) not in (int, float) or v < 0 for v in costs.values()):
+                raise ConfigurationError('Configuration error: rate limit costs must map commands to non-negative numbers.')
+            self._rate_limit.update(rate_limit)
+            self._rate_limit['costs'] = {**self._rate_limit['costs'], **costs}
+
+            # Validate and initialize the optional alert rules, e.g. {"wallet": "Dollar", "type": "budget", "limit": 500}
+            self._alerts = data.get('alerts', [])
+            for rule in self._alerts:
+                if rule.get('wallet') not in currencies:
+                    raise ConfigurationError(f'Configuration error: unknown wallet in the alert {rule}.')
+                if rule.get('type') not in ('budget', 'imbalance'):
+                    raise ConfigurationError(f'Configuration error: alert type must be "budget" or "imbalance" in {rule}.')
+                if type(rule.get('limit')) not in (int, float) or rule['limit'] <= 0:
+                    raise ConfigurationError(f'Configuration error: alert limit must be a positive number in {rule}.')
+
+            # Validate and initialize the optional number of worker processes
+            self._workers = data.get('workers', 1)
+            if type(self._workers) != int or self._workers < 1:
+                raise ConfigurationError('Configuration error: "workers" must be a positive integer.')
+            # The updates are sharded by chat, so the workers beyond one per user would stay idle
+            if self._workers > len(data['users']):
+                logger.warning(f'Configured workers reduced from {self._workers} to {len(data["users"])}, one per user')
+                self._workers = len(data['users'])
+
+            # Validate and initialize the optional storage settings
+            self._storage = data.get('storage', {'backend': 'sqlite'})
+            if self._storage.get('backend') not in ('sqlite', 'postgres', 'memory'):
+                raise ConfigurationError('Configuration error: storage backend must be one of "sqlite", "postgres" or "memory".')
+            if self._storage['backend'] == 'postgres' and 'dsn' not in self._storage:
+                raise ConfigurationError('Configuration error: "dsn" not defined for the postgres storage.')
+            if self._storage['backend'] == 'memory' and self._workers > 1:
+                raise ConfigurationError('Configuration error: the memory storage cannot be shared by several workers.')
 
             logger.info(f'Configured users: {self._user1["name"]} and {self._user2["name"]}')
             logger.info(f'Configured user IDs: {self._user2["chat_id"]} and {self._user2["chat_id"]}')
@@ -68,6 +134,27 @@ class Configuration:
         else:
             raise ValueError(f'Unable to find other chat_id of: {chat_id}')
 
+    def get_language(self, chat_id: int) -> str:
+        for user in self._users:
+            if user['chat_id'] == chat_id:
+                return user.get('language', 'en')
+        raise ValueError(f'Unknown chat_id {chat_id}')
+
+    def get_maintenance(self) -> Dict[str, Optional[float]]:
+        return dict(self._maintenance)
+
+    def get_rate_limit(self) -> Dict:
+        return {**self._rate_limit, 'costs': dict(self._rate_limit['costs'])}
+
+    def get_alerts(self) -> List[Dict]:
+        return [dict(rule) for rule in self._alerts]
+
+    def get_workers(self) -> int:
+        return self._workers
+
+    def get_storage(self) -> Dict[str, str]:
+        return dict(self._storage)
+
     def get_currencies(self) -> List[str]:
         return [w['currency'] for w in self._wallets]
 
@@ -77,6 +164,13 @@ class Configuration:
                 return w['symbol']
         raise ValueError(f'Unknown currency {currency}')
 
+    def get_wallet_words(self, currency: str) -> Optional[str]:
+        # Language in which the amounts of the wallet are also spelled out, DEFAULT_WALLET_WORDS unless configured
+        for w in self._wallets:
+            if w['currency'] == currency:
+                return w.get('words', DEFAULT_WALLET_WORDS.get(currency))
+        raise ValueError(f'Unknown currency {currency}')
+
 
 class ConfigurationError(ValueError):
     pass
@@ -1,80 +1,56 @@
-import os
+import logging
+import random
 import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing
 from datetime import datetime
-from sqlite3 import Connection
-from typing import Tuple, List
+from sqlite3 import Connection, Cursor
+from typing import Tuple, List, Iterator, Callable, Dict, Optional, TypeVar
 
+from alerts import Alert, AlertRules
 from configuration import Configuration
-from payment import Payment, PersistedPayment
+from ledger import apply_payment, from_signed, is_equal, to_signed
+from migrations import Migrator
+from payment import Payment, PersistedPayment, RecurringPayment
+from storage import Storage
 
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
 
-class Database:
+# Selects the columns of PersistedPayment, to be completed with the WHERE/ORDER BY clauses
+PAYMENTS_QUERY = 'SELECT payments.id, users.name, amount, wallets.wallet, note, dt FROM payments ' \
+                 'JOIN users ON payments.payer_id = users.id ' \
+                 'JOIN wallets ON payments.wallet_id = wallets.id '
 
-    def __init__(self, configuration: Configuration, database_path: str):
+# A snapshot of all the balances is stored every SNAPSHOT_INTERVAL payments
+SNAPSHOT_INTERVAL = 500
+
+# Writers wait up to BUSY_TIMEOUT seconds for the write lock, and a write is attempted up to WRITE_ATTEMPTS times
+BUSY_TIMEOUT = 10
+WRITE_ATTEMPTS = 5
+
+T = TypeVar('T')
+
+
+class Database(Storage):
+    """SQLite storage, which also provides the recurring payments, snapshots, corrections and maintenance."""
+
+    def __init__(self, configuration: Configuration, database_path: str, migrate: bool = True):
         self._configuration = configuration
         self._database_path = database_path
-        self._initialize()
+        self._alert_rules = AlertRules.from_configuration(configuration)
+        # The processes opening a database already migrated by another one, e.g. the workers, pass migrate=False
+        if migrate:
+            self._initialize()
+        # PRAGMA data_version of this connection changes whenever any other connection (or process) commits
+        self._version_connection = sqlite3.connect(database_path, check_same_thread=False)
+        self._version_lock = threading.Lock()
 
     def _initialize(self):
-        with sqlite3.connect(self._database_path) as connection:
-            cursor = connection.cursor()
-            try:
-                result = cursor.execute('SELECT name FROM sqlite_master')
-                if not result.fetchone():
-                    # Create and initialize users table
-                    cursor.execute("""
-                        CREATE TABLE IF NOT EXISTS "users" (
-                            "id"   INTEGER,
-                            "name" TEXT NOT NULL,
-                            PRIMARY KEY("id")
-                        );
-                    """)
-                    for name in self._configuration.get_usernames():
-                        cursor.execute(f'INSERT INTO users (name) VALUES ("{name}")')
-
-                    # Create and initialize wallets table
-                    cursor.execute("""
-                        CREATE TABLE IF NOT EXISTS "wallets" (
-                            "id"   INTEGER,
-                            "wallet" TEXT NOT NULL,
-                            PRIMARY KEY("id")
-                        );
-                    """)
-                    for wallet in self._configuration.get_currencies():
-                        cursor.execute(f'INSERT INTO wallets (wallet) VALUES ("{wallet}")')
-
-                    cursor.execute("""
-                        CREATE TABLE IF NOT EXISTS "payments" (
-                            "id"        INTEGER,
-                            "payer_id"  INTEGER,
-                            "amount"    INTEGER NOT NULL,
-                            "wallet_id" INTEGER,
-                            "note"      TEXT NOT NULL,
-                            "dt"        TEXT NOT NULL,
-                            PRIMARY KEY("id"),
-                            FOREIGN KEY("payer_id") REFERENCES users("id"),
-                            FOREIGN KEY("wallet_id") REFERENCES wallets("id")
-                        );
-                    """)
-
-                    cursor.execute("""
-                        CREATE TABLE IF NOT EXISTS "balances" (
-                            "id"        INTEGER,
-                            "user_id"   INTEGER,
-                            "balance"   INTEGER,
-                            "wallet_id" INTEGER,
-                            PRIMARY KEY("id"),
-                            FOREIGN KEY("user_id") REFERENCES users("id"),
-                            FOREIGN KEY("wallet_id") REFERENCES wallet("id")
-                        );
-                    """)
-
-                    connection.commit()
-            except Exception:
-                os.remove(self._database_path)
-                raise RuntimeError('Unable to create the database')
-            finally:
-                cursor.close()
+        for report in Migrator(self._database_path, self._configuration).migrate():
+            logging.info('Database migrated to version %d (%s) in %.3f s', report.version, report.description,
+                         report.seconds)
 
     @staticmethod
     def _get_user_id(connection: Connection, username: str) -> int:
@@ -86,22 +62,41 @@ class Database:
             raise ValueError(f'No user with username of "{username}" found')
 
     @staticmethod
-    def _add_payment(connection: Connection, payment: Payment):
+    def _add_payment(connection: Connection, payment: Payment, dt: datetime = None, reverses_id: int = None,
+                     replaces_id: int = None) -> int:
         cursor = connection.cursor()
         try:
-            cursor.execute('INSERT INTO payments (payer_id, amount, wallet_id, note, dt) VALUES ( '
+            cursor.execute('INSERT INTO payments (payer_id, amount, wallet_id, note, dt, reverses_id, replaces_id) VALUES ( '
                            '(SELECT id FROM users WHERE name = :username),'
                            ':amount,'
                            '(SELECT id FROM wallets WHERE wallet = :wallet),'
                            ':note, '
-                           ':dt)',
+                           ':dt, '
+                           ':reverses_id, '
+                           ':replaces_id)',
                            {'username': payment.payer, 'amount': float(payment.amount), 'wallet': payment.wallet,
-                            'note': payment.note, 'dt': datetime.strftime(datetime.now(), '%Y-%m-%d %H:%M:%S')})
+                            'note': payment.note, 'dt': datetime.strftime(dt or datetime.now(), DATETIME_FORMAT),
+                            'reverses_id': reverses_id, 'replaces_id': replaces_id})
+            payment_id = cursor.lastrowid
+            cursor.execute('INSERT INTO monthly_spending (wallet_id, month, amount) VALUES ('
+                           '(SELECT id FROM wallets WHERE wallet = :wallet), :month, :amount) '
+                           'ON CONFLICT (wallet_id, month) DO UPDATE SET amount = ROUND(amount + excluded.amount, 2)',
+                           {'wallet': payment.wallet, 'month': f'{dt or datetime.now():%Y-%m}',
+                            'amount': float(payment.amount)})
+            return payment_id
         finally:
             cursor.close()
 
     @staticmethod
-    def _increase_user_balance(connection: Connection, payment: Payment):
+    def _get_monthly_spending(connection: Connection, wallet: str, dt: datetime) -> float:
+        row = connection.execute('SELECT amount FROM monthly_spending '
+                                 'WHERE wallet_id = (SELECT id FROM wallets WHERE wallet = :wallet) AND month = :month',
+                                 {'wallet': wallet, 'month': f'{dt:%Y-%m}'}).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _increase_user_balance(connection: Connection, payment: Payment) -> Tuple[float, float]:
+        # Returns the debt in the wallet before and after the payment
         cursor = connection.cursor()
         try:
             # Get the user ID of the given username
@@ -111,7 +106,7 @@ class Database:
             payer_user_id = row[0]
 
             # Get the existing balance for the wallet
-            row = cursor.execute('SELECT balance, users.id AS user_id FROM balances '
+            row = cursor.execute('SELECT balance, users.id AS user_id, balances.id FROM balances '
                                  'JOIN users ON balances.user_id = users.id '
                                  'JOIN wallets ON balances.wallet_id = wallets.id '
                                  'WHERE wallets.wallet = :wallet', {'wallet': payment.wallet}).fetchone()
@@ -121,8 +116,13 @@ class Database:
             amount = float(payment.amount)
             # Compute new_user_id and new_balance
             if payer_user_id == old_user_id:
-                new_user_id = old_user_id
                 new_balance = old_balance + amount
+                if new_balance < 0:
+                    # Only a reversal (negative amount) can take more than the payer's credit
+                    new_user_id = cursor.execute('SELECT id FROM users WHERE id != :uid', {'uid': payer_user_id}).fetchone()[0]
+                    new_balance = -new_balance
+                else:
+                    new_user_id = old_user_id
             else:
                 new_balance = old_balance - amount
                 if new_balance < 0:
@@ -133,26 +133,82 @@ class Database:
 
             # Persist in the database
             if row:
-                cursor.execute('UPDATE balances SET user_id = :new_uid, balance = :new_bal '
-                               'WHERE user_id = :old_uid AND wallet_id = (SELECT id FROM wallets WHERE wallet = :wallet)',
-                               {'new_uid': new_user_id, 'new_bal': new_balance, 'old_uid': old_user_id, 'wallet': payment.wallet})
+                # No other writer can change the balance since it was read, as _write holds the write lock
+                cursor.execute('UPDATE balances SET user_id = :new_uid, balance = :new_bal WHERE id = :id',
+                               {'new_uid': new_user_id, 'new_bal': new_balance, 'id': row[2]})
             else:
                 cursor.execute('INSERT INTO balances (user_id, balance, wallet_id) VALUES ('
                                ':new_uid, '
                                ':new_bal, '
                                '(SELECT id FROM wallets WHERE wallet = :wallet))',
                                {'new_uid': new_user_id, 'new_bal': new_balance, 'wallet': payment.wallet})
+            return old_balance, new_balance
         finally:
             cursor.close()
 
-    def write_transaction(self, payment: Payment):
-        with sqlite3.connect(self._database_path) as connection:
+    @staticmethod
+    def _snapshot_if_due(connection: Connection, payment_id: int):
+        # The snapshot's dt is the latest dt of the payments it covers (payments can be written with a past dt),
+        # so that a snapshot with dt <= X covers only payments made up to X
+        if payment_id % SNAPSHOT_INTERVAL == 0:
+            connection.execute('INSERT INTO snapshots (payment_id, wallet_id, user_id, balance, dt) '
+                               'SELECT :pid, wallet_id, user_id, balance, (SELECT MAX(dt) FROM payments) FROM balances',
+                               {'pid': payment_id})
+
+    def _write(self, operation: Callable[[Connection], T]) -> T:
+        """Runs the operation in a BEGIN IMMEDIATE transaction and returns its result.
+
+        The write lock is taken before anything is read, so concurrent writers (threads or processes) are serialized
+        and every read-modify-write of a balance is linearizable. The operation is retried when the database stays
+        busy. Waiting for the lock blocks the calling thread, so the bot calls the writers through asyncio.to_thread.
+        """
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            connection = sqlite3.connect(self._database_path, isolation_level=None, timeout=BUSY_TIMEOUT)
             try:
-                self._add_payment(connection, payment)
-                self._increase_user_balance(connection, payment)
-            except Exception:
-                connection.rollback()
-                raise RuntimeError(f'Unable to write the payment to the database: {payment}')
+                connection.execute('BEGIN IMMEDIATE')
+                try:
+                    result = operation(connection)
+                    connection.execute('COMMIT')
+                    return result
+                except BaseException:
+                    connection.execute('ROLLBACK')
+                    raise
+            except sqlite3.OperationalError as e:
+                retryable = 'locked' in str(e) or 'busy' in str(e)
+                if not retryable or attempt == WRITE_ATTEMPTS:
+                    raise
+                logging.warning('Retrying a write to the database (attempt %d): %s', attempt, e)
+                time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+            finally:
+                connection.close()
+
+    def _apply_payment(self, connection: Connection, payment: Payment, dt: datetime = None, reverses_id: int = None,
+                       replaces_id: int = None) -> Tuple[int, Tuple[float, float], Tuple[float, float]]:
+        # Writes the payment and applies it to the balance, for every writer. Returns the ID of the payment, and the
+        # monthly spending and the debt of its wallet before and after it
+        dt = dt or datetime.now()
+        payment_id = self._add_payment(connection, payment, dt, reverses_id, replaces_id)
+        debt = self._increase_user_balance(connection, payment)
+        self._snapshot_if_due(connection, payment_id)
+        if payment.wallet not in self._alert_rules:
+            return payment_id, (0, 0), debt
+        # The running total of the month makes the budgets O(1) per payment, whatever the number of payments
+        spent = self._get_monthly_spending(connection, payment.wallet, dt)
+        return payment_id, (round(spent - float(payment.amount), 2), spent), debt
+
+    def _evaluate_alerts(self, wallet: str, first: tuple, last: tuple) -> List[Alert]:
+        # Evaluates the net change of the payments applied from "first" to "last", so that e.g. an edit does not fire
+        # again a rule its original payment has already fired
+        return self._alert_rules.evaluate(wallet, (first[1][0], last[1][1]), (first[2][0], last[2][1]))
+
+    def write_transaction(self, payment: Payment) -> List[Alert]:
+        def operation(connection: Connection) -> List[Alert]:
+            applied = self._apply_payment(connection, payment)
+            return self._evaluate_alerts(payment.wallet, applied, applied)
+        try:
+            return self._write(operation)
+        except Exception:
+            raise RuntimeError(f'Unable to write the payment to the database: {payment}')
 
     def get_balance(self, wallet: str) -> Tuple[str, str]:
         with sqlite3.connect(self._database_path) as connection:
@@ -167,18 +223,348 @@ class Database:
             finally:
                 cursor.close()
 
-    def get_payments(self) -> List[PersistedPayment]:
-        payments = []
+    def get_balances(self) -> Dict[str, Tuple[float, str]]:
+        """Returns the balance and the creditor of all the wallets with a registered balance."""
+        with closing(sqlite3.connect(self._database_path)) as connection:
+            rows = connection.execute('SELECT wallets.wallet, balance, users.name FROM balances '
+                                      'JOIN users ON balances.user_id = users.id '
+                                      'JOIN wallets ON balances.wallet_id = wallets.id').fetchall()
+        return {wallet: (balance, username) for wallet, balance, username in rows}
+
+    def get_version(self) -> int:
+        with self._version_lock:
+            return self._version_connection.execute('PRAGMA data_version').fetchone()[0]
+
+    def _payment_row_factory(self) -> Callable[[Cursor, tuple], PersistedPayment]:
+        # Payer, wallet and symbol strings repeat on every row, so share one interned copy of each
+        symbols = {}
+
+        def factory(_cursor: Cursor, row: tuple) -> PersistedPayment:
+            payment_id, payer, amount, wallet, note, dt = row
+            wallet = sys.intern(wallet)
+            symbol = symbols.get(wallet)
+            if symbol is None:
+                symbol = symbols[wallet] = sys.intern(self._configuration.get_wallet_symbol(wallet))
+            return PersistedPayment(sys.intern(payer), str(amount), wallet, symbol, note, dt, payment_id)
+        return factory
+
+    def iter_payments(self) -> Iterator[PersistedPayment]:
+        with closing(sqlite3.connect(self._database_path)) as connection:
+            connection.row_factory = self._payment_row_factory()
+            with closing(connection.cursor()) as cursor:
+                yield from cursor.execute(PAYMENTS_QUERY + 'ORDER BY payments.id')
+
+    def get_last_payments(self, count: int) -> List[PersistedPayment]:
+        with closing(sqlite3.connect(self._database_path)) as connection:
+            connection.row_factory = self._payment_row_factory()
+            with closing(connection.cursor()) as cursor:
+                rows = cursor.execute(PAYMENTS_QUERY + 'ORDER BY payments.id DESC LIMIT :count', {'count': count}).fetchall()
+        rows.reverse()
+        return rows
+
+    def add_recurring(self, payment: Payment, period: str, start: datetime) -> RecurringPayment:
+        start = start.replace(microsecond=0)
         with sqlite3.connect(self._database_path) as connection:
             cursor = connection.cursor()
             try:
-                rows = cursor.execute('SELECT users.name, amount, wallets.wallet, note, dt FROM payments '
-                                      'JOIN users ON payments.payer_id = users.id '
-                                      'JOIN wallets ON payments.wallet_id = wallets.id').fetchall()
-                if rows:
-                    for row in rows:
-                        wallet_symbol = self._configuration.get_wallet_symbol(row[2])
-                        payments.append(PersistedPayment(row[0], str(row[1]), row[2], wallet_symbol, row[3], row[4]))
+                cursor.execute('INSERT INTO recurring (payer_id, amount, wallet_id, note, period, start, next_due) VALUES ( '
+                               '(SELECT id FROM users WHERE name = :username),'
+                               ':amount,'
+                               '(SELECT id FROM wallets WHERE wallet = :wallet),'
+                               ':note, :period, :start, :start)',
+                               {'username': payment.payer, 'amount': float(payment.amount), 'wallet': payment.wallet,
+                                'note': payment.note, 'period': period, 'start': datetime.strftime(start, DATETIME_FORMAT)})
+                schedule_id = cursor.lastrowid
             finally:
                 cursor.close()
-        return payments
+        return RecurringPayment(schedule_id, payment.payer, payment.amount, payment.wallet, payment.wallet_symbol,
+                                payment.note, period, start, start)
+
+    def get_recurring(self) -> List[RecurringPayment]:
+        schedules = []
+        with closing(sqlite3.connect(self._database_path)) as connection:
+            with closing(connection.cursor()) as cursor:
+                rows = cursor.execute('SELECT recurring.id, users.name, amount, wallets.wallet, note, period, start, next_due '
+                                      'FROM recurring '
+                                      'JOIN users ON recurring.payer_id = users.id '
+                                      'JOIN wallets ON recurring.wallet_id = wallets.id '
+                                      'ORDER BY recurring.id')
+                for row in rows:
+                    schedules.append(RecurringPayment(row[0], row[1], str(row[2]), row[3],
+                                                      self._configuration.get_wallet_symbol(row[3]), row[4], row[5],
+                                                      datetime.strptime(row[6], DATETIME_FORMAT),
+                                                      datetime.strptime(row[7], DATETIME_FORMAT)))
+        return schedules
+
+    def delete_recurring(self, schedule_id: int) -> bool:
+        with sqlite3.connect(self._database_path) as connection:
+            return connection.execute('DELETE FROM recurring WHERE id = :id', {'id': schedule_id}).rowcount > 0
+
+    def run_recurring(self, schedule: RecurringPayment, due: datetime) -> Optional[List[Alert]]:
+        """Writes the occurrence of the schedule which was due at "due", moves the schedule to its next_due and
+        returns the alerts fired by the payment.
+
+        Returns None without writing anything if the occurrence has already been written or the schedule is deleted.
+        """
+        def operation(connection: Connection) -> Optional[List[Alert]]:
+            cursor = connection.execute('UPDATE recurring SET next_due = :next_due WHERE id = :id AND next_due = :due',
+                                        {'next_due': datetime.strftime(schedule.next_due, DATETIME_FORMAT),
+                                         'id': schedule.id, 'due': datetime.strftime(due, DATETIME_FORMAT)})
+            if cursor.rowcount == 0:
+                return None
+            applied = self._apply_payment(connection, schedule, due)
+            return self._evaluate_alerts(schedule.wallet, applied, applied)
+        try:
+            return self._write(operation)
+        except Exception:
+            raise RuntimeError(f'Unable to write the recurring payment to the database: {schedule}')
+
+    def get_balance_at(self, wallet: str, dt: datetime) -> Tuple[float, str]:
+        """Returns the balance and the creditor of the wallet including the payments made up to "dt".
+
+        Replays the payments of the wallet on top of the latest snapshot taken before "dt". Raises ValueError if the
+        payments needed for that are archived.
+        """
+        reference, other = self._configuration.get_usernames()
+        limit = datetime.strftime(dt, DATETIME_FORMAT)
+        with closing(sqlite3.connect(self._database_path)) as connection:
+            archived_until = self._get_archived_until(connection)
+            row = connection.execute('SELECT snapshots.payment_id, users.name, snapshots.balance FROM snapshots '
+                                     'JOIN users ON snapshots.user_id = users.id '
+                                     'JOIN wallets ON snapshots.wallet_id = wallets.id '
+                                     'WHERE wallets.wallet = :wallet AND snapshots.dt <= :dt '
+                                     'AND snapshots.payment_id >= :archived_until '
+                                     'ORDER BY snapshots.dt DESC, snapshots.payment_id DESC LIMIT 1',
+                                     {'wallet': wallet, 'dt': limit, 'archived_until': archived_until}).fetchone()
+            if not row and archived_until:
+                raise ValueError(f'The payments up to payment {archived_until} are archived')
+            signed, after_id = (to_signed(row[1], row[2], reference), row[0]) if row else (0, 0)
+            rows = connection.execute('SELECT users.name, amount FROM payments '
+                                      'JOIN users ON payments.payer_id = users.id '
+                                      'WHERE payments.wallet_id = (SELECT id FROM wallets WHERE wallet = :wallet) '
+                                      'AND payments.id > :after_id AND payments.dt <= :dt',
+                                      {'wallet': wallet, 'after_id': after_id, 'dt': limit})
+            for payer, amount in rows:
+                signed = apply_payment(signed, payer, amount, reference)
+        return from_signed(signed, reference, other)
+
+    def verify(self) -> List[str]:
+        """Replays the whole payments table in one pass and returns the inconsistencies found in the stored snapshots
+        and balances. An empty list means the ledger is consistent."""
+        reference, other = self._configuration.get_usernames()
+
+        def describe(value: float) -> str:
+            balance, creditor = from_signed(value, reference, other)
+            return f'{round(balance, 2)} for {creditor}'
+
+        problems = []
+        signed = {}
+        with closing(sqlite3.connect(self._database_path)) as connection:
+            # Archived payments are replaced by the snapshot written at the archive boundary
+            archived_until = self._get_archived_until(connection)
+            snapshots = connection.execute('SELECT snapshots.payment_id, wallets.wallet, users.name, snapshots.balance '
+                                           'FROM snapshots '
+                                           'JOIN users ON snapshots.user_id = users.id '
+                                           'JOIN wallets ON snapshots.wallet_id = wallets.id '
+                                           'WHERE snapshots.payment_id >= :archived_until '
+                                           'ORDER BY snapshots.payment_id', {'archived_until': archived_until}).fetchall()
+            snapshot_index = 0
+            if archived_until:
+                while snapshot_index < len(snapshots) and snapshots[snapshot_index][0] == archived_until:
+                    _, wallet, creditor, balance = snapshots[snapshot_index]
+                    signed[wallet] = to_signed(creditor, balance, reference)
+                    snapshot_index += 1
+                if not signed:
+                    problems.append(f'No snapshot found at the archive boundary (payment {archived_until})')
+
+            def check_snapshots(until_id: float):
+                # Snapshots taken at payment P must match the replay of the payments up to P
+                nonlocal snapshot_index
+                while snapshot_index < len(snapshots) and snapshots[snapshot_index][0] <= until_id:
+                    payment_id, wallet, creditor, balance = snapshots[snapshot_index]
+                    stored = to_signed(creditor, balance, reference)
+                    if not is_equal(signed.get(wallet, 0), stored):
+                        problems.append(f'Snapshot of {wallet} at payment {payment_id}: '
+                                        f'stored {describe(stored)}, expected {describe(signed.get(wallet, 0))}')
+                    snapshot_index += 1
+
+            rows = connection.execute('SELECT payments.id, wallets.wallet, users.name, amount FROM payments '
+                                      'JOIN users ON payments.payer_id = users.id '
+                                      'JOIN wallets ON payments.wallet_id = wallets.id '
+                                      'ORDER BY payments.id')
+            for payment_id, wallet, payer, amount in rows:
+                check_snapshots(payment_id - 1)
+                signed[wallet] = apply_payment(signed.get(wallet, 0), payer, amount, reference)
+            check_snapshots(float('inf'))
+
+        balances = {wallet: to_signed(creditor, balance, reference)
+                    for wallet, (balance, creditor) in self.get_balances().items()}
+        for wallet in sorted(set(signed) | set(balances)):
+            if not is_equal(signed.get(wallet, 0), balances.get(wallet, 0)):
+                problems.append(f'Balance of {wallet}: stored {describe(balances.get(wallet, 0))}, '
+                                f'expected {describe(signed.get(wallet, 0))}')
+        return problems
+
+    def _get_payment(self, connection: Connection, payment_id: int) -> PersistedPayment:
+        connection.row_factory = self._payment_row_factory()
+        try:
+            payment = connection.execute(PAYMENTS_QUERY + 'WHERE payments.id = :id', {'id': payment_id}).fetchone()
+        finally:
+            connection.row_factory = None
+        if not payment:
+            raise ValueError(f'No payment with ID {payment_id} found')
+        return payment
+
+    def _write_reversal(self, connection: Connection, payment_id: int) -> Tuple[PersistedPayment, tuple]:
+        original = self._get_payment(connection, payment_id)
+        row = connection.execute('SELECT reverses_id, (SELECT id FROM payments WHERE reverses_id = :id) FROM payments '
+                                 'WHERE id = :id', {'id': payment_id}).fetchone()
+        if row[0] is not None:
+            raise ValueError(f'Payment {payment_id} is a reversal itself')
+        if row[1] is not None:
+            raise ValueError(f'Payment {payment_id} is already reversed by payment {row[1]}')
+        reversal = Payment(original.payer, str(-float(original.amount)), original.wallet, original.wallet_symbol,
+                           f'Reversal of payment {payment_id}')
+        applied = self._apply_payment(connection, reversal, reverses_id=payment_id)
+        return self._get_payment(connection, applied[0]), applied
+
+    def reverse_payment(self, payment_id: int = None) -> Tuple[PersistedPayment, List[Alert]]:
+        """Writes a payment reversing the given one, or the latest one which is not reversed if no ID is given,
+        and returns the reversal with the alerts it fired. Raises ValueError if there is no such payment or it cannot
+        be reversed."""
+        def operation(connection: Connection) -> Tuple[PersistedPayment, List[Alert]]:
+            reversed_id = payment_id
+            if reversed_id is None:
+                row = connection.execute('SELECT id FROM payments AS p WHERE reverses_id IS NULL AND NOT EXISTS '
+                                         '(SELECT 1 FROM payments WHERE reverses_id = p.id) '
+                                         'ORDER BY id DESC LIMIT 1').fetchone()
+                if not row:
+                    raise ValueError('No payment to undo')
+                reversed_id = row[0]
+            reversal, applied = self._write_reversal(connection, reversed_id)
+            return reversal, self._evaluate_alerts(reversal.wallet, applied, applied)
+        try:
+            return self._write(operation)
+        except ValueError:
+            raise
+        except Exception:
+            raise RuntimeError(f'Unable to reverse the payment {payment_id}')
+
+    def edit_payment(self, payment_id: int, amount: str, note: str = None) \
+            -> Tuple[PersistedPayment, PersistedPayment, List[Alert]]:
+        """Reverses the given payment and writes its corrected version. Returns the reversal, the new payment and the
+        alerts fired by the correction as a whole."""
+        def operation(connection: Connection) -> Tuple[PersistedPayment, PersistedPayment, List[Alert]]:
+            reversal, reversed_ = self._write_reversal(connection, payment_id)
+            original = self._get_payment(connection, payment_id)
+            payment = Payment(original.payer, amount, original.wallet, original.wallet_symbol, note or original.note)
+            applied = self._apply_payment(connection, payment, replaces_id=payment_id)
+            alerts = self._evaluate_alerts(payment.wallet, reversed_, applied)
+            return reversal, self._get_payment(connection, applied[0]), alerts
+        try:
+            return self._write(operation)
+        except ValueError:
+            raise
+        except Exception:
+            raise RuntimeError(f'Unable to edit the payment {payment_id}')
+
+    def get_audit_trail(self, payment_id: int) -> List[PersistedPayment]:
+        """Returns the payment followed by the payments reversing or replacing it, in the order they were written."""
+        with closing(sqlite3.connect(self._database_path)) as connection:
+            connection.row_factory = self._payment_row_factory()
+            return connection.execute(PAYMENTS_QUERY + 'WHERE payments.id = :id OR payments.reverses_id = :id '
+                                      'OR payments.replaces_id = :id ORDER BY payments.id', {'id': payment_id}).fetchall()
+
+    @staticmethod
+    def _get_archived_until(connection: Connection) -> int:
+        # The archive always keeps the latest payment, so a gap before the first payment means an archived range
+        first_id = connection.execute('SELECT MIN(id) FROM payments').fetchone()[0]
+        return first_id - 1 if first_id else 0
+
+    def _write_snapshot(self, connection: Connection, payment_id: int):
+        """Writes a snapshot of all the wallets including the payments up to "payment_id"."""
+        reference, other = self._configuration.get_usernames()
+        signed = {}
+        base_id, base_dt = connection.execute('SELECT payment_id, dt FROM snapshots WHERE payment_id <= :pid '
+                                              'ORDER BY payment_id DESC LIMIT 1', {'pid': payment_id}).fetchone() or (0, '')
+        rows = connection.execute('SELECT wallets.wallet, users.name, snapshots.balance FROM snapshots '
+                                  'JOIN users ON snapshots.user_id = users.id '
+                                  'JOIN wallets ON snapshots.wallet_id = wallets.id '
+                                  'WHERE snapshots.payment_id = :pid', {'pid': base_id})
+        for wallet, creditor, balance in rows:
+            signed[wallet] = to_signed(creditor, balance, reference)
+        rows = connection.execute('SELECT wallets.wallet, users.name, amount FROM payments '
+                                  'JOIN users ON payments.payer_id = users.id '
+                                  'JOIN wallets ON payments.wallet_id = wallets.id '
+                                  'WHERE payments.id > :base_id AND payments.id <= :pid ORDER BY payments.id',
+                                  {'base_id': base_id, 'pid': payment_id})
+        for wallet, payer, amount in rows:
+            signed[wallet] = apply_payment(signed.get(wallet, 0), payer, amount, reference)
+        dt = connection.execute('SELECT MAX(dt) FROM payments WHERE id <= :pid', {'pid': payment_id}).fetchone()[0]
+        dt = max(dt or '', base_dt)
+
+        user_ids = dict(connection.execute('SELECT name, id FROM users'))
+        connection.execute('DELETE FROM snapshots WHERE payment_id = :pid', {'pid': payment_id})
+        for wallet_id, wallet in connection.execute('SELECT id, wallet FROM wallets').fetchall():
+            balance, creditor = from_signed(signed.get(wallet, 0), reference, other)
+            connection.execute('INSERT INTO snapshots (payment_id, wallet_id, user_id, balance, dt) '
+                               'VALUES (:pid, :wid, :uid, :balance, :dt)',
+                               {'pid': payment_id, 'wid': wallet_id, 'uid': user_ids[creditor], 'balance': balance, 'dt': dt})
+
+    def archive_payments(self, before: datetime, archive_path: str, batch_size: int = 1000) -> int:
+        """Moves the payments made before "before" into the database at "archive_path" and returns their count.
+
+        The balances are not affected. A snapshot is written at the archive boundary first, so that replays and
+        verification start from it. Payments are moved in batches, each in its own transaction, so that the bot can
+        keep writing in between.
+        """
+        with sqlite3.connect(self._database_path) as connection:
+            first_id, last_id = connection.execute('SELECT MIN(id), MAX(id) FROM payments').fetchone()
+            if last_id is None:
+                return 0
+            boundary = connection.execute('SELECT MIN(id) FROM payments WHERE dt >= :before',
+                                          {'before': datetime.strftime(before, DATETIME_FORMAT)}).fetchone()[0]
+            # Only archive a prefix of the payments, and keep the latest one so that the IDs are never reused
+            boundary = min(boundary - 1 if boundary is not None else last_id, last_id - 1)
+            if boundary < first_id:
+                return 0
+            self._write_snapshot(connection, boundary)
+
+        moved = 0
+        with closing(sqlite3.connect(self._database_path)) as connection:
+            connection.execute('ATTACH DATABASE :path AS archive', {'path': archive_path})
+            with connection:
+                for table in ('users', 'wallets', 'payments'):
+                    connection.execute(f'CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT * FROM main.{table} WHERE 0')
+                for table in ('users', 'wallets'):
+                    connection.execute(f'DELETE FROM archive.{table}')
+                    connection.execute(f'INSERT INTO archive.{table} SELECT * FROM main.{table}')
+            while True:
+                with connection:
+                    low = connection.execute('SELECT MIN(id) FROM main.payments').fetchone()[0]
+                    if low > boundary:
+                        break
+                    high = min(low + batch_size - 1, boundary)
+                    connection.execute('INSERT INTO archive.payments SELECT * FROM main.payments WHERE id BETWEEN :low AND :high',
+                                       {'low': low, 'high': high})
+                    moved += connection.execute('DELETE FROM main.payments WHERE id BETWEEN :low AND :high',
+                                                {'low': low, 'high': high}).rowcount
+            connection.execute('DETACH DATABASE archive')
+        return moved
+
+    def backup(self, target_path: str, pages: int = 256):
+        """Copies the database to "target_path" with the online backup API, "pages" pages at a time."""
+        with closing(sqlite3.connect(self._database_path)) as source, closing(sqlite3.connect(target_path)) as target:
+            source.backup(target, pages=pages, sleep=0.01)
+
+    def optimize(self, vacuum_pages: int = 1000):
+        with closing(sqlite3.connect(self._database_path, isolation_level=None)) as connection:
+            if connection.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                # One-time full VACUUM to switch to incremental vacuum, later runs free pages in small steps
+                connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                connection.execute('VACUUM')
+            else:
+                while connection.execute('PRAGMA freelist_count').fetchone()[0] > 0:
+                    connection.execute(f'PRAGMA incremental_vacuum({int(vacuum_pages)})').fetchall()
+            connection.execute('ANALYZE')
+            connection.execute('PRAGMA optimize')
@@ -0,0 +1,89 @@
+import csv
+import json
+import os
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class ExchangeRates:
+    """Offline exchange-rate table.
+
+    The table is a list of (from, to, rate) pairs meaning "1 from = rate to". Currencies which are not directly
+    quoted against each other are converted by triangulating through the base currency, so every pair of
+    reachable currencies gets a rate. The full rate matrix is computed once when the table is loaded.
+    """
+
+    def __init__(self, base: str, pairs: Iterable[Tuple[str, str, float]]):
+        self.base = base
+        graph: Dict[str, List[Tuple[str, float]]] = {base: []}
+        for from_currency, to_currency, rate in pairs:
+            if rate <= 0:
+                raise ValueError(f'Invalid exchange rate from {from_currency} to {to_currency}: {rate}')
+            graph.setdefault(from_currency, []).append((to_currency, rate))
+            graph.setdefault(to_currency, []).append((from_currency, 1 / rate))
+
+        # Value of one unit of every currency in the base currency
+        values = {base: 1.0}
+        queue = deque([base])
+        while queue:
+            currency = queue.popleft()
+            for neighbour, rate in graph[currency]:
+                if neighbour not in values:
+                    values[neighbour] = values[currency] / rate
+                    queue.append(neighbour)
+        self._matrix: Dict[str, Dict[str, float]] = {
+            a: {b: value_a / value_b for b, value_b in values.items()} for a, value_a in values.items()
+        }
+
+    @staticmethod
+    def load(path: str, base: Optional[str] = None) -> 'ExchangeRates':
+        """Loads a rate table from a .csv file with "from,to,rate" columns or a .json file of the form
+        {"base": "Euro", "rates": [{"from": "Dollar", "to": "Euro", "rate": 0.92}, ...]}."""
+        if os.path.splitext(path)[1].lower() == '.csv':
+            with open(path, newline='') as f:
+                pairs = [(row['from'], row['to'], float(row['rate'])) for row in csv.DictReader(f)]
+        else:
+            with open(path) as f:
+                data = json.load(f)
+            base = base or data.get('base')
+            pairs = [(r['from'], r['to'], float(r['rate'])) for r in data['rates']]
+        if not pairs:
+            raise ValueError(f'No exchange rates found in {path}')
+        return ExchangeRates(base or pairs[0][0], pairs)
+
+    def get_currencies(self) -> List[str]:
+        return list(self._matrix)
+
+    def get_rate(self, from_currency: str, to_currency: str) -> float:
+        try:
+            return self._matrix[from_currency][to_currency]
+        except KeyError:
+            raise ValueError(f'No exchange rate from {from_currency} to {to_currency}')
+
+    def convert_all(self, amounts: Dict[str, float], to_currency: str) -> float:
+        """Converts the amounts of several currencies into one currency and returns their sum."""
+        if to_currency not in self._matrix:
+            raise ValueError(f'Unknown currency {to_currency}')
+        total = 0.0
+        for currency, amount in amounts.items():
+            total += amount * self.get_rate(currency, to_currency)
+        return total
+
+
+class CachedExchangeRates:
+    """Loads the rate table from a file and reloads it only when the file has changed."""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._mtime = None
+        self._rates = None
+
+    def get(self) -> Optional[ExchangeRates]:
+        try:
+            mtime = os.stat(self._path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime != self._mtime:
+            self._rates = ExchangeRates.load(self._path)
+            self._mtime = mtime
+        return self._rates
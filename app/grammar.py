@@ -0,0 +1,49 @@
+import re
+from typing import Dict, Iterable, Optional
+
+from configuration import Configuration
+from payment import Payment
+
+AMOUNT = r'[0-9]+(?:\.[0-9]{2})?'
+
+
+class Grammar:
+    """Patterns of all the user input, compiled once from the configuration.
+
+    Besides the keyboard answers of the /update conversation, it parses the one-shot payment syntax
+    "/pay <amount> <wallet> <payer> [note]", where the wallet can also be given by its symbol, e.g.
+    "/pay 25.50 € Julia dinner". Wallets and payers are matched case-insensitively in that syntax.
+    """
+
+    def __init__(self, configuration: Configuration, confirmations: Iterable[str] = ('Yes', 'No')):
+        self._configuration = configuration
+        currencies = configuration.get_currencies()
+        usernames = configuration.get_usernames()
+
+        # Keyboard answers are matched exactly
+        self.wallet = re.compile(f'^({"|".join(map(re.escape, currencies))})$')
+        self.payer = re.compile(f'^({"|".join(map(re.escape, usernames))})$')
+        self.amount = re.compile(f'^{AMOUNT}$')
+        self.confirm = re.compile(f'^({"|".join(map(re.escape, confirmations))})$')
+        self.callback = re.compile(r'^pay:(?P<token>\w+):(?P<answer>yes|no)$')
+
+        # Aliases of the wallets and the payers in the one-shot syntax, longest first so that they match greedily
+        self._wallets: Dict[str, str] = {}
+        for currency in currencies:
+            self._wallets[currency.casefold()] = currency
+            self._wallets.setdefault(configuration.get_wallet_symbol(currency).casefold(), currency)
+        self._payers = {username.casefold(): username for username in usernames}
+        wallets = '|'.join(map(re.escape, sorted(self._wallets, key=len, reverse=True)))
+        payers = '|'.join(map(re.escape, sorted(self._payers, key=len, reverse=True)))
+        self.pay = re.compile(rf'^/pay(?:@\w+)?\s+(?P<amount>{AMOUNT})\s*(?P<wallet>{wallets})\s+(?P<payer>{payers})'
+                              rf'(?:\s+(?P<note>.+))?$', re.IGNORECASE | re.DOTALL)
+
+    def parse_payment(self, text: str) -> Optional[Payment]:
+        """Parses the one-shot payment syntax, or returns None if the text does not match it."""
+        match = self.pay.match(text.strip())
+        if not match:
+            return None
+        wallet = self._wallets[match['wallet'].casefold()]
+        payer = self._payers[match['payer'].casefold()]
+        note = (match['note'] or '').strip() or '-'
+        return Payment(payer, match['amount'], wallet, self._configuration.get_wallet_symbol(wallet), note)
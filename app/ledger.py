@@ -0,0 +1,20 @@
+from typing import Tuple
+
+# Balances are replayed as a single signed number per wallet: positive when the reference user is the creditor,
+# negative when the other user is. The balances table stores the same value as (creditor, non-negative balance).
+
+
+def to_signed(creditor: str, balance: float, reference: str) -> float:
+    return balance if creditor == reference else -balance
+
+
+def from_signed(signed: float, reference: str, other: str) -> Tuple[float, str]:
+    return (signed, reference) if signed >= 0 else (-signed, other)
+
+
+def apply_payment(signed: float, payer: str, amount: float, reference: str) -> float:
+    return signed + amount if payer == reference else signed - amount
+
+
+def is_equal(a: float, b: float) -> bool:
+    return abs(a - b) < 1e-6
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import copy
+import json
+import string
+from datetime import date, datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import num2persian
+from configuration import DEFAULT_WALLET_WORDS, Configuration, ConfigurationError
+
+LOCALES_DIRECTORY = str(Path(__file__).parent / 'locales')
+DEFAULT_LANGUAGE = 'en'
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+DIGITS = {'latin': None, 'persian': str.maketrans('0123456789.', '۰۱۲۳۴۵۶۷۸۹٫')}
+CALENDARS = ('gregorian', 'jalali')
+
+# Number-to-words engines by language. An engine spells out an integral amount given as a string, e.g. '1250', and
+# raises ValueError for the amounts it cannot spell out
+NUMBER_WORDS: Dict[str, Callable[[str], str]] = {}
+
+
+def register_number_words(language: str, engine: Callable[[str], str]):
+    NUMBER_WORDS[language] = engine
+
+
+ONES = ['zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight', 'nine', 'ten', 'eleven', 'twelve',
+        'thirteen', 'fourteen', 'fifteen', 'sixteen', 'seventeen', 'eighteen', 'nineteen']
+TENS = ['', '', 'twenty', 'thirty', 'forty', 'fifty', 'sixty', 'seventy', 'eighty', 'ninety']
+SCALES = ['', 'thousand', 'million', 'billion', 'trillion', 'quadrillion']
+
+
+def english_words(number: str) -> str:
+    value = int(number)
+    if value < 0:
+        return f'minus {english_words(str(-value))}'
+    if value >= 1000 ** len(SCALES):
+        raise ValueError(f'Number out of range: {number}')
+    if value == 0:
+        return ONES[0]
+    groups = []
+    scale = 0
+    while value:
+        value, group = divmod(value, 1000)
+        if group:
+            groups.append(f'{_english_hundreds(group)} {SCALES[scale]}'.rstrip())
+        scale += 1
+    return ' '.join(reversed(groups))
+
+
+def _english_hundreds(number: int) -> str:
+    hundreds, rest = divmod(number, 100)
+    words = [f'{ONES[hundreds]} hundred'] if hundreds else []
+    if rest >= 20:
+        tens, ones = divmod(rest, 10)
+        words.append(f'{TENS[tens]}-{ONES[ones]}' if ones else TENS[tens])
+    elif rest:
+        words.append(ONES[rest])
+    return ' '.join(words)
+
+
+register_number_words('en', english_words)
+register_number_words('fa', num2persian.to_words)
+
+
+def to_jalali(day: date) -> Tuple[int, int, int]:
+    """Converts a Gregorian date to the (year, month, day) of the Jalali (Solar Hijri) calendar."""
+    days_before_month = [0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334]
+    year = day.year + 1 if day.month > 2 else day.year
+    days = 355666 + 365 * day.year + (year + 3) // 4 - (year + 99) // 100 + (year + 399) // 400 + day.day + \
+        days_before_month[day.month - 1]
+    jalali_year = -1595 + 33 * (days // 12053)
+    days %= 12053
+    jalali_year += 4 * (days // 1461)
+    days %= 1461
+    if days > 365:
+        jalali_year += (days - 1) // 365
+        days = (days - 1) % 365
+    if days < 186:
+        return jalali_year, 1 + days // 31, 1 + days % 31
+    return jalali_year, 7 + (days - 186) // 30, 1 + (days - 186) % 30
+
+
+class Locale:
+    """Messages and number and date formatting of one language.
+
+    The message templates are compiled once into bound str.format methods, so getting a message is one lookup and
+    one call. Amounts of some wallets are also spelled out, by the speller of that wallet.
+    """
+
+    def __init__(self, language: str, messages: Dict[str, str], digits: str = 'latin', calendar: str = 'gregorian',
+                 currency_names: Dict[str, str] = None):
+        if digits not in DIGITS:
+            raise ValueError(f'Unknown digits "{digits}" in the {language} catalog')
+        if calendar not in CALENDARS:
+            raise ValueError(f'Unknown calendar "{calendar}" in the {language} catalog')
+        self.language = language
+        self._messages: Dict[str, Callable[..., str]] = {key: template.format for key, template in messages.items()}
+        self._digits = DIGITS[digits]
+        self._jalali = calendar == 'jalali'
+        self._currency_names = currency_names or {}
+        self._spellers: Dict[str, Callable[[str], str]] = {}
+
+    def with_spellers(self, spellers: Dict[str, Callable[[str], str]]) -> Locale:
+        """Returns a copy, sharing the compiled messages, which spells out the amounts of the given wallets."""
+        locale = copy.copy(self)
+        locale._spellers = spellers
+        return locale
+
+    def get(self, key: str, **fields) -> str:
+        return self._messages[key](**fields)
+
+    def get_currency_name(self, currency: str) -> str:
+        return self._currency_names.get(currency, currency)
+
+    def format_number(self, number: str) -> str:
+        return number.translate(self._digits) if self._digits else number
+
+    def format_datetime(self, dt: datetime, seconds: bool = True) -> str:
+        if self._jalali:
+            year, month, day = to_jalali(dt)
+            text = f'{year:04}-{month:02}-{day:02} {dt:%H:%M:%S}'
+        else:
+            text = f'{dt:%Y-%m-%d %H:%M:%S}'
+        return self.format_number(text if seconds else text[:-3])
+
+    def format_date(self, text: str) -> str:
+        """Formats a date stored as text, e.g. the date of a persisted payment."""
+        if not self._jalali and not self._digits:
+            return text
+        try:
+            return self.format_datetime(datetime.strptime(text, DATETIME_FORMAT))
+        except ValueError:
+            return self.format_number(text)
+
+    def spell(self, wallet: str, amount: str) -> Optional[str]:
+        """Returns the amount in words if it is spelled out for the wallet, otherwise None."""
+        speller = self._spellers.get(wallet)
+        if not speller:
+            return None
+        try:
+            return speller(amount)
+        except ValueError:
+            return None
+
+
+@lru_cache(maxsize=None)
+def load_locales(directory: str = LOCALES_DIRECTORY) -> Dict[str, Locale]:
+    """Compiles the catalogs of the directory, one <language>.json file per language, once per process.
+
+    A message missing from a catalog falls back to the default language, and every message must use the same fields
+    as the one of the default language.
+    """
+    catalogs = {}
+    for path in sorted(Path(directory).glob('*.json')):
+        with open(path, encoding='utf-8') as f:
+            catalogs[path.stem] = json.load(f)
+    if DEFAULT_LANGUAGE not in catalogs:
+        raise ValueError(f'Catalog of the default language "{DEFAULT_LANGUAGE}" not found in {directory}')
+
+    defaults = catalogs[DEFAULT_LANGUAGE]['messages']
+    fields = {key: _get_fields(template) for key, template in defaults.items()}
+    locales = {}
+    for language, catalog in catalogs.items():
+        messages = dict(defaults)
+        for key, template in catalog['messages'].items():
+            if key not in fields:
+                raise ValueError(f'Unknown message "{key}" in the {language} catalog')
+            if _get_fields(template) != fields[key]:
+                raise ValueError(f'Message "{key}" of the {language} catalog must use the fields {sorted(fields[key])}')
+            messages[key] = template
+        locales[language] = Locale(language, messages, catalog.get('digits', 'latin'),
+                                   catalog.get('calendar', 'gregorian'), catalog.get('currency_names'))
+    return locales
+
+
+def _get_fields(template: str) -> Set[str]:
+    return {name for _, name, _, _ in string.Formatter().parse(template) if name is not None}
+
+
+@lru_cache(maxsize=None)
+def get_default_locale() -> Locale:
+    """The default language, spelling out the amounts of the DEFAULT_WALLET_WORDS wallets, for the payments formatted
+    without a configuration."""
+    locales = load_locales()
+    return locales[DEFAULT_LANGUAGE].with_spellers(_create_spellers(locales, DEFAULT_WALLET_WORDS))
+
+
+class Localization:
+    """Locales of the configured users, and the wallets whose amounts are spelled out (by the "words" language of the
+    wallet, whatever the language of the reader)."""
+
+    def __init__(self, configuration: Configuration, directory: str = LOCALES_DIRECTORY):
+        locales = load_locales(directory)
+
+        words = {}
+        for currency in configuration.get_currencies():
+            language = configuration.get_wallet_words(currency)
+            if language is None:
+                continue
+            if language not in NUMBER_WORDS:
+                raise ConfigurationError(f'Configuration error: no number-to-words engine for the language "{language}".')
+            words[currency] = language
+        spellers = _create_spellers(locales, words)
+        self._locales = {language: locale.with_spellers(spellers) for language, locale in locales.items()}
+
+        self._languages = {}
+        for chat_id in configuration.get_chat_ids():
+            language = configuration.get_language(chat_id)
+            if language not in self._locales:
+                raise ConfigurationError(f'Configuration error: no catalog for the language "{language}".')
+            self._languages[chat_id] = language
+
+    def get_locale(self, chat_id: int) -> Locale:
+        return self._locales[self._languages.get(chat_id, DEFAULT_LANGUAGE)]
+
+    def get_confirmations(self) -> List[str]:
+        """Returns the "yes" and "no" answers of all the languages."""
+        return [locale.get(answer) for locale in self._locales.values() for answer in ('yes', 'no')]
+
+
+def _create_spellers(locales: Dict[str, Locale], words: Dict[str, str]) -> Dict[str, Callable[[str], str]]:
+    # The amounts are followed by the name of the currency in the language of the words
+    return {currency: _create_speller(NUMBER_WORDS[language],
+                                      locales.get(language, locales[DEFAULT_LANGUAGE]).get_currency_name(currency))
+            for currency, language in words.items()}
+
+
+def _create_speller(engine: Callable[[str], str], unit: str) -> Callable[[str], str]:
+    def speller(amount: str) -> str:
+        return f'{engine(amount)} {unit}'
+    return speller
@@ -0,0 +1,121 @@
+import copy
+import functools
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import List, Optional
+
+# Attributes of a LogRecord which are passed through to the JSON record when set via "extra"
+STRUCTURED_FIELDS = ('user', 'command', 'latency_ms')
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Already formatted by the RecordQueueHandler the record went through
+            data['exception'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class RecordQueueHandler(QueueHandler):
+    """Puts the records to a queue with their message and traceback kept apart, unlike QueueHandler which merges the
+    traceback into the message.
+
+    The message is merged with its arguments and the traceback formatted into exc_text, so that the record can be
+    pickled, e.g. to the queue of another process.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+def _gzip_namer(name: str) -> str:
+    return f'{name}.gz'
+
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def create_file_handler(log_path: str, max_bytes: int = 5 * 1024 * 1024, backup_count: int = 5,
+                        when: Optional[str] = None, compress: bool = True) -> logging.Handler:
+    """Creates a JSON file handler rotated by size, or by time if "when" (e.g. 'midnight') is given."""
+    if when:
+        handler = TimedRotatingFileHandler(log_path, when=when, backupCount=backup_count, encoding='utf-8')
+    else:
+        handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    if compress:
+        handler.namer = _gzip_namer
+        handler.rotator = _gzip_rotator
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def setup_logging(handlers: List[logging.Handler], level: int = logging.INFO) -> QueueListener:
+    """Routes the root logger through a queue, so the given handlers do their I/O on a listener thread.
+
+    The returned listener is already started; stop it on shutdown to flush the pending records.
+    """
+    log_queue = queue.SimpleQueue()
+    forward_logging(log_queue, level)
+    return listen_logging(log_queue, handlers)
+
+
+def listen_logging(log_queue, handlers: List[logging.Handler]) -> QueueListener:
+    """Starts a listener passing the records of the queue, e.g. a multiprocessing queue of the worker processes, to
+    the given handlers."""
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def forward_logging(log_queue, level: int = logging.INFO):
+    """Replaces the handlers of the root logger with one putting the records to the queue."""
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(RecordQueueHandler(log_queue))
+
+
+def log_command(command: str):
+    """Decorates a Telegram handler to log the issued command along with the user and the handling latency."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            start = time.perf_counter()
+            try:
+                return await handler(update, context)
+            finally:
+                user = update.effective_user.first_name if update.effective_user else None
+                latency_ms = round((time.perf_counter() - start) * 1000, 2)
+                logging.info('User %s issued /%s command', user, command,
+                             extra={'user': user, 'command': command, 'latency_ms': latency_ms})
+        return wrapper
+    return decorator
@@ -1,22 +1,45 @@
+import asyncio
+import atexit
 import logging
+import math
+import multiprocessing
 import os
+import signal
 import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from typing import Callable, Dict, List, Optional
 
-from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
 from telegram.ext import (
     Application,
+    ApplicationHandlerStop,
+    CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
     ConversationHandler,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 
+from alerts import Alert
+from cache import LRUCache
 from configuration import Configuration
 from database import Database
-from payment import Payment, PersistedPayment
+from exchange import CachedExchangeRates, ExchangeRates
+from grammar import Grammar
+from localization import Locale, Localization
+from logs import create_file_handler, forward_logging, listen_logging, log_command, setup_logging
+from maintenance import Maintenance
+from payment import Payment, PersistedPayment, RecurringPayment
+from ratelimit import Coalescer, RateLimiter
+from sharding import ShardedDispatcher
+from scheduler import PERIODS, Scheduler, next_occurrence
+from storage import Storage, create_storage
 
 # Ensure the env variable is present
 version_env = os.environ.get('VERSION', None)
@@ -27,40 +50,119 @@ if not volumes_dir_env:
     raise RuntimeError('VOLUMES_DIRECTORY not defined as an environment variable')
 volumes_dir = Path(volumes_dir_env)
 
-# Enable logging
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setLevel(logging.INFO)
-file_handler = logging.FileHandler(Path.joinpath(volumes_dir, 'log.txt'))
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        console_handler,
-        file_handler
-    ]
-)
-
-# Create and initialize the configuration
-config = Configuration(str(Path(volumes_dir, 'config.json')), logging)
-
-# Create and initialize the database
-database = Database(config, str(Path(volumes_dir, 'db.sq3')))
+# Set up by initialize(), so that importing this module, as the spawned worker and export processes do, opens nothing
+config: Configuration
+localization: Localization
+grammar: Grammar
+database: Storage
+sqlite_backend = False
+maintenance: Optional[Maintenance] = None
+rate_limiter: RateLimiter
+application: Application
+
+# Rendered texts: a persisted payment never changes, and a balance is keyed by the version of the ledger it was read
+# from, so every write makes the cached balances unreachable and they are evicted over time
+payment_texts = LRUCache(1024)
+balance_texts = LRUCache(64)
+
+
+async def post_init(app: Application):
+    # Start firing the persisted recurring payments, including the ones missed while the bot was down
+    if not sqlite_backend:
+        return
+    for schedule in database.get_recurring():
+        scheduler.add(schedule)
+    app.create_task(scheduler.run())
+
+
+# Concurrent /history calls share one export
+history_exports = Coalescer()
+# Exports run in another process, so that they do not compete with the handlers for this one
+history_pool: Optional[ProcessPoolExecutor] = None
+# Number of /history exports kept on disk, see export_history
+KEPT_EXPORTS = 3
+# Versions of the ledger are only comparable within one process
+history_prefix = f'wallet-history-{os.getpid()}-{int(datetime.now().timestamp())}'
+
+# Exchange rates used to sum up the wallets, maintained offline in volumes/rates.json or volumes/rates.csv. The file
+# is looked up on every /total, so that it can be added or replaced while the bot runs
+RATES_PATHS = (Path(volumes_dir, 'rates.json'), Path(volumes_dir, 'rates.csv'))
+exchange_rates: Dict[Path, CachedExchangeRates] = {}
+
+
+def open_storage(migrate: bool = True):
+    """Loads the configuration and opens the storage, which is migrated unless another process has already done it."""
+    global config, database, sqlite_backend
+    # Create and initialize the configuration
+    config = Configuration(str(Path(volumes_dir, 'config.json')), logging)
+
+    # Create and initialize the storage backend configured in config.json (SQLite by default)
+    database = create_storage(config, str(volumes_dir), migrate)
+    # Recurring payments, corrections, snapshots and maintenance are provided by the SQLite backend
+    sqlite_backend = isinstance(database, Database)
+
+
+def initialize(worker: bool = False):
+    """Sets up the bot, in the main process or in a worker process, which relies on the main one for the migrations
+    and the maintenance."""
+    global localization, grammar, maintenance, rate_limiter, application
+    open_storage(migrate=not worker)
+
+    # Message catalogs and the language of each user, compiled once
+    localization = Localization(config)
+
+    # Patterns of the user input, compiled once
+    grammar = Grammar(config, localization.get_confirmations())
+
+    # Back up, archive and optimize the database in the background
+    if sqlite_backend and not worker:
+        maintenance = Maintenance(database, str(Path(volumes_dir, 'backups')), str(Path(volumes_dir, 'archive.sq3')),
+                                  **config.get_maintenance())
+
+    # Every user has a budget of commands
+    rate_limit = config.get_rate_limit()
+    rate_limiter = RateLimiter(rate_limit['capacity'], rate_limit['refill_per_second'], rate_limit['costs'])
+
+    # Build the application
+    logging.info(f'Detected version: {version_env}')
+    application = Application.builder().token(config.get_token()).post_init(post_init).build()
+    add_handlers()
 
-# Build the application
-logging.info(f'Detected version: {version_env}')
-application = Application.builder().token(config.get_token()).build()
 
 # State of the conversations
 WALLET, PAYER, NOTE, AMOUNT, CONFIRM = range(5)
 WALLET_BALANCE = 5
 
+# A /pay payment waits for its confirmation up to PENDING_PAYMENT_SECONDS, and a chat keeps up to MAX_PENDING_PAYMENTS
+PENDING_PAYMENT_SECONDS = 3600
+MAX_PENDING_PAYMENTS = 20
+
+
+# ------------------- rate limit of all the updates -------------------
+async def limit_rate(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Runs before all the handlers: drops the updates of the other chats and the ones over the user's budget
+    chat = update.effective_chat
+    if not chat or chat.id not in config.get_chat_ids():
+        raise ApplicationHandlerStop()
+    command = get_command(update)
+    wait = rate_limiter.acquire(chat.id, command)
+    if wait is None:
+        context.chat_data.pop('rate_limited', None)
+        return
+    # Reply once per burst, so that a spamming client does not make the bot spam back
+    logging.warning('Rate limit of chat %s exceeded by /%s', chat.id, command, extra={'command': command})
+    if update.message and not context.chat_data.get('rate_limited'):
+        context.chat_data['rate_limited'] = True
+        await update.message.reply_text(get_locale(update).get('rate_limited', seconds=math.ceil(wait)))
+    raise ApplicationHandlerStop()
+
 
 # ------------------- update conversation functions -------------------
+@log_command('update')
 async def update_choose_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    logging.info("User %s issued /update command", update.message.from_user.first_name)
     reply_keyboard = [config.get_currencies()]
     await update.message.reply_text(
-        'Which wallet do you want to change?',
+        get_locale(update).get('update.choose_wallet'),
         reply_markup=ReplyKeyboardMarkup(
             reply_keyboard, one_time_keyboard=True
         ),
@@ -72,7 +174,7 @@ async def update_choose_payer(update: Update, context: ContextTypes.DEFAULT_TYPE
     context.chat_data['wallet'] = update.message.text
     reply_keyboard = [config.get_usernames()]
     await update.message.reply_text(
-        'Whose balance to increase?',
+        get_locale(update).get('update.choose_payer'),
         reply_markup=ReplyKeyboardMarkup(
             reply_keyboard, one_time_keyboard=True
         ),
@@ -83,8 +185,7 @@ async def update_choose_payer(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def update_enter_amount(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.chat_data['payer'] = update.message.text
     await update.message.reply_text(
-        'Ok.\n'
-        f'How many {context.chat_data["wallet"]}s?',
+        get_locale(update).get('update.enter_amount', wallet=context.chat_data['wallet']),
         reply_markup=ReplyKeyboardRemove(),
     )
     return AMOUNT
@@ -93,8 +194,7 @@ async def update_enter_amount(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def update_enter_note(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.chat_data['amount'] = update.message.text
     await update.message.reply_text(
-        'Ok.\n'
-        'Do you have a note for this payment? If not, enter /skip .',
+        get_locale(update).get('update.enter_note'),
         reply_markup=ReplyKeyboardRemove(),
     )
     return NOTE
@@ -107,50 +207,114 @@ async def update_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     cd = context.chat_data
     payment = Payment(cd['payer'], cd['amount'], cd['wallet'], config.get_wallet_symbol(cd['wallet']), cd['note'])
     cd['payment'] = payment
-    reply_keyboard = [['Yes', 'No']]
+    locale = get_locale(update)
+    reply_keyboard = [[locale.get('yes'), locale.get('no')]]
     await update.message.reply_text(
-        'Do you confirm the following payment?\n'
-        f'{payment.format()}',
+        locale.get('update.confirm', payment=payment.format(locale)),
         reply_markup=ReplyKeyboardMarkup(
-            reply_keyboard, one_time_keyboard=True, input_field_placeholder='Yes or No'
+            reply_keyboard, one_time_keyboard=True, input_field_placeholder=locale.get('yes_or_no')
         ),
     )
     return CONFIRM
 
 
 async def update_end(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    if update.message.text == 'Yes':
+    locale = get_locale(update)
+    if update.message.text == locale.get('yes'):
         payment = context.chat_data['payment']
-        logging.info('User %s finalized /update command. Parameters: %s', update.message.from_user.first_name, payment.jsonify())
-        database.write_transaction(payment)
+        user = update.message.from_user.first_name
+        logging.info('User %s finalized /update command. Parameters: %s', user, payment.jsonify(),
+                     extra={'user': user, 'command': 'update'})
+        alerts = await register_payment(payment, update.message.chat_id)
         await update.message.reply_text(
-            get_formatted_balance(payment.wallet),
+            await get_formatted_balance(payment.wallet, locale) + await format_alerts(alerts, locale),
             reply_markup=ReplyKeyboardRemove(),
         )
-
-        # Inform the other user about the payment
-        other = config.get_other_chat_id(update.message.chat_id)
-        msg = f'{payment.format()}\n' \
-              f'New status:\n' \
-              f'{get_formatted_balance(payment.wallet)}'
-        await application.bot.send_message(
-            chat_id=other,
-            text=msg
-        )
     else:
         await update.message.reply_text(
-            'Ok, the process is canceled.',
+            locale.get('canceled'),
             reply_markup=ReplyKeyboardRemove(),
         )
     return ConversationHandler.END
 
 
+async def register_payment(payment: Payment, chat_id: int) -> List[Alert]:
+    # Write the payment and inform the other user about it and the alerts it fired, in their language
+    alerts = await asyncio.to_thread(database.write_transaction, payment)
+    other = config.get_other_chat_id(chat_id)
+    locale = localization.get_locale(other)
+    msg = locale.get('status.new', description=payment.format(locale),
+                     balance=await get_formatted_balance(payment.wallet, locale))
+    await application.bot.send_message(
+        chat_id=other,
+        text=msg + await format_alerts(alerts, locale)
+    )
+    return alerts
+
+
+# ------------------ one-shot pay command --------------------
+@log_command('pay')
+async def pay_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    locale = get_locale(update)
+    payment = grammar.parse_payment(update.message.text)
+    if not payment:
+        await update.message.reply_text(
+            locale.get('pay.usage', wallet=config.get_currencies()[0], payer=config.get_usernames()[0])
+        )
+        return ConversationHandler.END
+
+    # The pending payment is kept until one of the inline buttons is pressed or it expires, and the expired ones and
+    # the oldest ones over the limit are dropped, so that unanswered payments do not pile up in the chat data
+    token = str(update.message.message_id)
+    pending = context.chat_data.setdefault('pending_payments', {})
+    now = time.monotonic()
+    for expired in [t for t, (_, created) in pending.items() if now - created > PENDING_PAYMENT_SECONDS]:
+        del pending[expired]
+    while len(pending) >= MAX_PENDING_PAYMENTS:
+        del pending[next(iter(pending))]
+    pending[token] = (payment, now)
+    await update.message.reply_text(
+        locale.get('update.confirm', payment=payment.format(locale)),
+        reply_markup=InlineKeyboardMarkup([[
+            InlineKeyboardButton(locale.get('yes'), callback_data=f'pay:{token}:yes'),
+            InlineKeyboardButton(locale.get('no'), callback_data=f'pay:{token}:no'),
+        ]]),
+    )
+    return ConversationHandler.END
+
+
+async def pay_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    if update.effective_chat.id not in config.get_chat_ids():
+        return ConversationHandler.END
+    locale = get_locale(update)
+    match = grammar.callback.match(query.data)
+    pending = context.chat_data.get('pending_payments', {}).pop(match['token'], None)
+    payment = pending[0] if pending else None
+    if not payment:
+        await query.edit_message_text(locale.get('pay.handled'))
+    elif time.monotonic() - pending[1] > PENDING_PAYMENT_SECONDS:
+        await query.edit_message_text(locale.get('pay.expired'))
+    elif match['answer'] == 'yes':
+        user = update.effective_user.first_name
+        logging.info('User %s finalized /pay command. Parameters: %s', user, payment.jsonify(),
+                     extra={'user': user, 'command': 'pay'})
+        alerts = await register_payment(payment, update.effective_chat.id)
+        await query.edit_message_text(locale.get('status.new', description=payment.format(locale),
+                                                 balance=await get_formatted_balance(payment.wallet, locale))
+                                      + await format_alerts(alerts, locale))
+    else:
+        await query.edit_message_text(locale.get('pay.canceled'))
+    return ConversationHandler.END
+
+
 # ------------------ status conversation --------------------
+@log_command('status')
 async def status_choose_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    logging.info("User %s issued /status command", update.message.from_user.first_name)
     reply_keyboard = [config.get_currencies()]
     await update.message.reply_text(
-        'Which wallet do you want to see?',
+        get_locale(update).get('status.choose_wallet'),
         reply_markup=ReplyKeyboardMarkup(
             reply_keyboard, one_time_keyboard=True
         ),
@@ -161,90 +325,376 @@ async def status_choose_wallet(update: Update, context: ContextTypes.DEFAULT_TYP
 async def status_end(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     wallet = update.message.text
     await update.message.reply_text(
-        get_formatted_balance(wallet),
+        await get_formatted_balance(wallet, get_locale(update)),
         reply_markup=ReplyKeyboardRemove(),
     )
     return ConversationHandler.END
 
 
 # ------------------ last 5 command --------------------
+@log_command('last5')
 async def last_5_payments(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    logging.info("User %s issued /last5 command", update.message.from_user.first_name)
-    payments = database.get_payments()[-5:]
+    locale = get_locale(update)
+    payments = await asyncio.to_thread(database.get_last_payments, 5)
     if payments:
         msg = ''
         for payment in payments:
-            msg += f'{payment.format()}\n'
+            msg += f'{format_payment(payment, locale)}\n'
     else:
-        msg = 'No payments registered'
+        msg = locale.get('last5.empty')
     await update.message.reply_text(text=msg)
     return ConversationHandler.END
 
 
 # ------------------ history command --------------------
+@log_command('history')
 async def history_payments(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    logging.info("User %s issued /history command", update.message.from_user.first_name)
-    history_json = f'/tmp/{datetime.now()}.json'
-    with open(history_json, 'w') as f:
-        f.write(PersistedPayment.jsonify_all(database.get_payments()))
-    await update.message.reply_document(
-        document=history_json,
-        filename=f'history.json'
-    )
+    global history_pool
+    if history_pool is None and database.shared:
+        # The export process only reads the storage, which this process has already migrated
+        history_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=open_storage, initargs=(False,))
+    version = await asyncio.to_thread(database.get_version)
+    prefix = str(Path(tempfile.gettempdir(), history_prefix))
+    # Without the pool, i.e. for a storage which another process cannot open, the export runs on a thread of this one
+    history_json = await history_exports.run(
+        version, lambda: asyncio.get_running_loop().run_in_executor(history_pool, export_history, prefix, version))
+    with open(history_json, 'rb') as f:
+        await update.message.reply_document(
+            document=f,
+            filename=f'history.json'
+        )
+    return ConversationHandler.END
+
+
+def export_history(prefix: str, version: int) -> str:
+    # One export per version of the ledger, reused until the next write. The KEPT_EXPORTS latest ones are kept, so that
+    # the callers still sending an older one (e.g. coalesced into it just before a write) do not lose it
+    history_json = Path(f'{prefix}-{version}.json')
+    if not history_json.exists():
+        with open(f'{history_json}.tmp', 'w') as f:
+            PersistedPayment.dump_all(database.iter_payments(), f)
+        os.replace(f'{history_json}.tmp', history_json)
+        exports = sorted(history_json.parent.glob(f'{Path(prefix).name}-*.json'),
+                         key=lambda path: int(path.stem.rsplit('-', 1)[1]))
+        for old in exports[:-KEPT_EXPORTS]:
+            old.unlink(missing_ok=True)
+    return str(history_json)
+
+
+# ------------------ total command --------------------
+@log_command('total')
+async def total_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    locale = get_locale(update)
+    rates_path = next((p for p in RATES_PATHS if p.exists()), RATES_PATHS[0])
+    if rates_path not in exchange_rates:
+        exchange_rates[rates_path] = CachedExchangeRates(str(rates_path))
+    try:
+        rates = exchange_rates[rates_path].get()
+    except (OSError, KeyError, TypeError, ValueError) as e:
+        # e.g. a malformed or incomplete file, answered like a missing one
+        logging.error('Unable to load the exchange rates from %s: %r', rates_path, e)
+        rates = None
+    if not rates:
+        msg = locale.get('total.no_rates', path=rates_path.name)
+    elif len(context.args) != 1:
+        msg = locale.get('total.usage', currencies=', '.join(rates.get_currencies()))
+    else:
+        try:
+            msg = await asyncio.to_thread(get_formatted_total, rates, context.args[0], locale)
+        except ValueError as e:
+            msg = str(e)
+    await update.message.reply_text(text=msg)
+    return ConversationHandler.END
+
+
+# ------------------ undo, delete and edit commands --------------------
+async def reply_and_notify_correction(update: Update, describe: Callable[[Locale], str], wallet: str,
+                                      alerts: List[Alert]):
+    locale = get_locale(update)
+    balance = await get_formatted_balance(wallet, locale)
+    msg = locale.get('status.new', description=describe(locale), balance=balance)
+    await update.message.reply_text(text=msg + await format_alerts(alerts, locale))
+
+    # Inform the other user about the correction and the alerts it fired, in their language
+    other = config.get_other_chat_id(update.message.chat_id)
+    locale = localization.get_locale(other)
+    balance = await get_formatted_balance(wallet, locale)
+    msg = locale.get('status.new', description=describe(locale), balance=balance)
+    await application.bot.send_message(chat_id=other, text=msg + await format_alerts(alerts, locale))
+
+
+@log_command('undo')
+async def undo_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    try:
+        reversal, alerts = await asyncio.to_thread(database.reverse_payment)
+    except ValueError as e:
+        await update.message.reply_text(text=str(e))
+        return ConversationHandler.END
+    await reply_and_notify_correction(
+        update, lambda locale: locale.get('reversal.registered', payment=reversal.format(locale)), reversal.wallet,
+        alerts)
+    return ConversationHandler.END
+
+
+@log_command('delete')
+async def delete_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    if len(context.args) != 1 or not context.args[0].isdigit():
+        await update.message.reply_text(text=get_locale(update).get('delete.usage'))
+        return ConversationHandler.END
+    try:
+        reversal, alerts = await asyncio.to_thread(database.reverse_payment, int(context.args[0]))
+    except ValueError as e:
+        await update.message.reply_text(text=str(e))
+        return ConversationHandler.END
+    await reply_and_notify_correction(
+        update, lambda locale: locale.get('reversal.registered', payment=reversal.format(locale)), reversal.wallet,
+        alerts)
+    return ConversationHandler.END
+
+
+@log_command('edit')
+async def edit_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    args = context.args
+    if len(args) < 2 or not args[0].isdigit() or not grammar.amount.match(args[1]):
+        await update.message.reply_text(text=get_locale(update).get('edit.usage'))
+        return ConversationHandler.END
+    try:
+        reversal, payment, alerts = await asyncio.to_thread(database.edit_payment, int(args[0]), args[1],
+                                                            ' '.join(args[2:]) or None)
+    except ValueError as e:
+        await update.message.reply_text(text=str(e))
+        return ConversationHandler.END
+    await reply_and_notify_correction(
+        update, lambda locale: locale.get('edit.corrected', id=args[0], payment=payment.format(locale)), payment.wallet,
+        alerts)
+    return ConversationHandler.END
+
+
+# ------------------ asof command --------------------
+@log_command('asof')
+async def asof_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    locale = get_locale(update)
+    try:
+        wallet, date = context.args
+        if wallet not in config.get_currencies():
+            raise ValueError(f'Unknown wallet {wallet}')
+        # The given date is included as a whole
+        dt = datetime.strptime(date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+    except ValueError:
+        await update.message.reply_text(text=locale.get('asof.usage', wallets='|'.join(config.get_currencies())))
+        return ConversationHandler.END
+    try:
+        amount, creditor = await asyncio.to_thread(database.get_balance_at, wallet, dt)
+    except ValueError as e:
+        await update.message.reply_text(text=str(e))
+        return ConversationHandler.END
+    amount = round(amount, 2)
+    if amount:
+        msg = format_amount(locale, creditor, str(amount), config.get_wallet_symbol(wallet))
+    else:
+        msg = locale.get('balance.settled')
+    date = locale.format_datetime(dt)[:10]
+    await update.message.reply_text(text=locale.get('asof.status', wallet=wallet, date=date, balance=msg))
+    return ConversationHandler.END
+
+
+# ------------------ verify command --------------------
+@log_command('verify')
+async def verify_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    locale = get_locale(update)
+    # Replays the whole ledger, so it runs on a thread to keep handling the other updates meanwhile
+    problems = await asyncio.to_thread(database.verify)
+    if problems:
+        logging.error('Ledger verification failed: %s', problems)
+        msg = locale.get('verify.inconsistent', problems='\n'.join(problems))
+    else:
+        msg = locale.get('verify.consistent')
+    await update.message.reply_text(text=msg)
     return ConversationHandler.END
 
 
+# ------------------ recurring command --------------------
+@log_command('recurring')
+async def recurring_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    locale = get_locale(update)
+    args = context.args
+    if not args:
+        schedules = await asyncio.to_thread(database.get_recurring)
+        msg = '\n'.join(s.format(locale) for s in schedules) if schedules else locale.get('recurring.empty')
+    elif args[0] == 'delete' and len(args) == 2 and args[1].isdigit():
+        schedule_id = int(args[1])
+        if await asyncio.to_thread(database.delete_recurring, schedule_id):
+            scheduler.remove(schedule_id)
+            msg = locale.get('recurring.deleted', id=schedule_id)
+        else:
+            msg = locale.get('recurring.not_found', id=schedule_id)
+    elif len(args) >= 4 and args[0] in PERIODS and args[1] in config.get_currencies() \
+            and args[2] in config.get_usernames() and grammar.amount.match(args[3]):
+        period, wallet, payer, amount = args[:4]
+        note = ' '.join(args[4:]) or '-'
+        now = datetime.now()
+        payment = Payment(payer, amount, wallet, config.get_wallet_symbol(wallet), note)
+        schedule = await asyncio.to_thread(database.add_recurring, payment, period, next_occurrence(period, now, now))
+        scheduler.add(schedule)
+        msg = locale.get('recurring.registered', payment=schedule.format(locale))
+    else:
+        msg = locale.get('recurring.usage', periods='|'.join(PERIODS))
+    await update.message.reply_text(text=msg)
+    return ConversationHandler.END
+
+
+async def run_recurring_payment(schedule: RecurringPayment, due: datetime):
+    alerts = await asyncio.to_thread(database.run_recurring, schedule, due)
+    if alerts is not None:
+        logging.info('Recurring payment %s due at %s is registered', schedule.id, due)
+        for chat_id in config.get_chat_ids():
+            locale = localization.get_locale(chat_id)
+            msg = locale.get('recurring.run', payment=schedule.format(locale),
+                             balance=await get_formatted_balance(schedule.wallet, locale))
+            await application.bot.send_message(chat_id=chat_id, text=msg + await format_alerts(alerts, locale))
+
+
+scheduler = Scheduler(run_recurring_payment)
+
+
 # ------------------ about command --------------------
+@log_command('about')
 async def about_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    logging.info("User %s issued /about command", update.message.from_user.first_name)
-    await update.message.reply_text(text=f'Shared wallet Telegram Bot v{version_env}')
+    stats = ', '.join(f'{name}: {cache.get_stats()}' for name, cache in (('payments', payment_texts),
+                                                                          ('balances', balance_texts)))
+    await update.message.reply_text(text=get_locale(update).get('about', version=version_env, caches=stats))
     return ConversationHandler.END
 
 
 # ----------- cancel current operation for all the conversations -------------
+@log_command('cancel')
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    logging.info("User %s issued /cancel command", update.message.from_user.first_name)
     context.chat_data.clear()
     await update.message.reply_text(
-        'Ok, the process is canceled.', reply_markup=ReplyKeyboardRemove()
+        get_locale(update).get('canceled'), reply_markup=ReplyKeyboardRemove()
     )
     return ConversationHandler.END
 
 
+# ------------------ multi-process mode --------------------
+dispatcher: Optional[ShardedDispatcher] = None
+
+
+async def dispatch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Runs in the main process before all the handlers: forwards the update to the worker of its chat. /recurring is
+    # handled here, along with the scheduler of the recurring payments
+    if update.effective_chat and get_command(update) != 'recurring':
+        dispatcher.forward(update.effective_chat.id, update.to_dict())
+        raise ApplicationHandlerStop()
+
+
+def run_worker(index: int, updates: multiprocessing.Queue, worker_logs: multiprocessing.Queue):
+    # Entry point of the worker processes. The main process stops them, so ignore Ctrl+C sent to the whole group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    forward_logging(worker_logs)
+    initialize(worker=True)
+    logging.info('Worker %s started', index)
+    asyncio.run(process_updates(updates))
+    logging.info('Worker %s stopped', index)
+
+
+async def process_updates(updates: multiprocessing.Queue):
+    async with application:
+        while (data := await asyncio.to_thread(updates.get)) is not None:
+            await application.process_update(Update.de_json(data, application.bot))
+
+
 # --------------------- Utility methods -----------------------
-def get_formatted_balance(wallet: str) -> str:
+def get_command(update: Update) -> Optional[str]:
+    text = update.message.text if update.message and update.message.text else ''
+    return text[1:].split(maxsplit=1)[0].split('@')[0] if text.startswith('/') and len(text) > 1 else None
+
+
+def get_locale(update: Update) -> Locale:
+    return localization.get_locale(update.effective_chat.id)
+
+
+def format_payment(payment: PersistedPayment, locale: Locale) -> str:
+    if payment.id is None:
+        return payment.format(locale)
+    return payment_texts.get_or_set((payment.id, locale.language), lambda: payment.format(locale))
+
+
+async def get_formatted_balance(wallet: str, locale: Locale) -> str:
+    # The storage may be a remote server, so it is read on a thread, and the balance only when its text is not cached
+    return await asyncio.to_thread(lambda: balance_texts.get_or_set((wallet, database.get_version(), locale.language),
+                                                                    lambda: format_balance(wallet, locale)))
+
+
+def format_balance(wallet: str, locale: Locale) -> str:
     record = database.get_balance(wallet)
     if record:
         amount = record[0]
         if amount != '0':
-            creditor = record[1]
-            debtor = config.get_other_username(creditor)
-            symbol = config.get_wallet_symbol(wallet)
-            return f'{creditor}: {amount} {symbol}\n{debtor}: 0 {symbol}'
-    return '0'
+            return format_amount(locale, record[1], amount, config.get_wallet_symbol(wallet))
+    return locale.get('balance.settled')
+
+
+def format_amount(locale: Locale, creditor: str, amount: str, symbol: str) -> str:
+    return locale.get('balance', creditor=creditor, amount=locale.format_number(amount), symbol=symbol,
+                      debtor=config.get_other_username(creditor))
+
+
+async def format_alerts(alerts: List[Alert], locale: Locale) -> str:
+    # Appended to the messages about a payment, empty if it fired no alert
+    lines = []
+    for alert in alerts:
+        wallet = alert.rule.wallet
+        symbol = config.get_wallet_symbol(wallet)
+        creditor = (await asyncio.to_thread(database.get_balance, wallet))[1]
+        lines.append(locale.get(f'alert.{alert.rule.type}', wallet=wallet, value=locale.format_number(str(alert.value)),
+                                limit=locale.format_number(str(alert.rule.limit)), symbol=symbol,
+                                debtor=config.get_other_username(creditor)))
+    return ''.join(f'\n\n{line}' for line in lines)
+
+
+def get_formatted_total(rates: ExchangeRates, currency: str, locale: Locale) -> str:
+    # Net all the wallets from the point of view of the first user, using the stored balances
+    first_user = config.get_usernames()[0]
+    amounts = {wallet: balance if creditor == first_user else -balance
+               for wallet, (balance, creditor) in database.get_balances().items()}
+    total = round(rates.convert_all(amounts, currency), 2)
+    if total == 0:
+        return locale.get('balance.settled')
+    creditor = first_user if total > 0 else config.get_other_username(first_user)
+    symbol = config.get_wallet_symbol(currency) if currency in config.get_currencies() else currency
+    return format_amount(locale, creditor, str(abs(total)), symbol)
 
 
 # -------------------------------------------------
-def main():
+def add_handlers():
+    # Add the rate limit in front of all the other handlers
+    application.add_handler(TypeHandler(Update, limit_rate), group=-1)
+
     # Add conversation handler for changing a wallet
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler('update', update_choose_wallet, filters.User(config.get_chat_ids()))],
         states={
-            WALLET: [MessageHandler(filters.Regex(f'^({"|".join(config.get_currencies())})$'), update_choose_payer)],
-            PAYER: [MessageHandler(filters.Regex(f'^({"|".join(config.get_usernames())})$'), update_enter_amount)],
-            AMOUNT: [MessageHandler(filters.Regex('^[0-9]+(.[0-9]{2})?$') & ~filters.COMMAND, update_enter_note)],
+            WALLET: [MessageHandler(filters.Regex(grammar.wallet), update_choose_payer)],
+            PAYER: [MessageHandler(filters.Regex(grammar.payer), update_enter_amount)],
+            AMOUNT: [MessageHandler(filters.Regex(grammar.amount) & ~filters.COMMAND, update_enter_note)],
             NOTE: [MessageHandler(filters.TEXT & ~filters.COMMAND, update_confirm), CommandHandler('skip', update_confirm)],
-            CONFIRM: [MessageHandler(filters.Regex('^(Yes|No)$'), update_end)],
+            CONFIRM: [MessageHandler(filters.Regex(grammar.confirm), update_end)],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
     )
     application.add_handler(conv_handler)
 
+    # Add command handler for registering a payment in one message, confirmed through inline buttons
+    application.add_handler(CommandHandler('pay', pay_handler, filters.User(config.get_chat_ids())))
+    application.add_handler(CallbackQueryHandler(pay_confirm, pattern=grammar.callback))
+
     # Add conversation handler for getting wallet status
     wallet_status_handler = ConversationHandler(
         entry_points=[CommandHandler('status', status_choose_wallet, filters.User(config.get_chat_ids()))],
         states={
-            WALLET_BALANCE: [MessageHandler(filters.Regex(f'^({"|".join(config.get_currencies())})$'), status_end)],
+            WALLET_BALANCE: [MessageHandler(filters.Regex(grammar.wallet), status_end)],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
     )
@@ -256,11 +706,60 @@ def main():
     # Add command handler to get the full history of the payments
     application.add_handler(CommandHandler('history', history_payments, filters.User(config.get_chat_ids())))
 
+    # Add command handler to get the sum of all the wallets in one currency
+    application.add_handler(CommandHandler('total', total_handler, filters.User(config.get_chat_ids())))
+
+    if sqlite_backend:
+        # Add command handlers to correct the registered payments
+        application.add_handler(CommandHandler('undo', undo_handler, filters.User(config.get_chat_ids())))
+        application.add_handler(CommandHandler('delete', delete_handler, filters.User(config.get_chat_ids())))
+        application.add_handler(CommandHandler('edit', edit_handler, filters.User(config.get_chat_ids())))
+
+        # Add command handlers to get the status of a wallet at a date, and to verify the whole ledger
+        application.add_handler(CommandHandler('asof', asof_handler, filters.User(config.get_chat_ids())))
+        application.add_handler(CommandHandler('verify', verify_handler, filters.User(config.get_chat_ids())))
+
+        # Add command handler to list, add and delete recurring payments
+        application.add_handler(CommandHandler('recurring', recurring_handler, filters.User(config.get_chat_ids())))
+
     # Add command handler to get general information about the bot
     application.add_handler(CommandHandler('about', about_handler, filters.User(config.get_chat_ids())))
 
+
+def main():
+    # Enable logging: handlers run on a background listener, and the log file is rotated and gzipped. The worker
+    # processes pass their records to this one, see run_worker
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    file_handler = create_file_handler(str(Path.joinpath(volumes_dir, 'log.txt')))
+    log_listener = setup_logging([console_handler, file_handler])
+    atexit.register(log_listener.stop)
+
+    initialize()
+
+    # Shard the updates between several worker processes if configured. The ledger stays consistent as every write is
+    # serialized by the storage, e.g. by BEGIN IMMEDIATE in SQLite
+    global dispatcher
+    worker_log_listener = None
+    if config.get_workers() > 1:
+        worker_logs = multiprocessing.get_context('spawn').Queue()
+        worker_log_listener = listen_logging(worker_logs, [console_handler, file_handler])
+        dispatcher = ShardedDispatcher(config.get_workers(), run_worker, (worker_logs,), config.get_chat_ids())
+        dispatcher.start()
+        application.add_handler(TypeHandler(Update, dispatch), group=-2)
+
     # Start the Bot
+    if maintenance:
+        maintenance.start()
     application.run_polling()
+    if maintenance:
+        maintenance.stop()
+    if dispatcher:
+        dispatcher.stop()
+        worker_log_listener.stop()
+    if history_pool:
+        history_pool.shutdown()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,66 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional
+
+from database import Database
+
+
+class Maintenance:
+    """Periodically backs up, archives and optimizes the database on a background thread.
+
+    All the steps work incrementally (the backup copies a few pages at a time, archiving moves payments in batches
+    and vacuuming frees pages in steps), so the bot keeps serving while the maintenance runs.
+    """
+
+    def __init__(self, database: Database, backup_directory: str, archive_path: str, interval_hours: float = 24,
+                 backups: int = 7, archive_after_years: Optional[int] = None):
+        self._database = database
+        self._backup_directory = Path(backup_directory)
+        self._archive_path = archive_path
+        self._interval = timedelta(hours=interval_hours)
+        self._backups = backups
+        self._archive_after_years = archive_after_years
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def backup(self) -> str:
+        self._backup_directory.mkdir(parents=True, exist_ok=True)
+        target = str(Path(self._backup_directory, f'db-{datetime.now():%Y%m%d-%H%M%S}.sq3'))
+        self._database.backup(target)
+        for old_backup in self.get_backups()[:-self._backups or None]:
+            os.remove(old_backup)
+        return target
+
+    def get_backups(self) -> List[str]:
+        # The timestamped names sort chronologically
+        return sorted(str(p) for p in self._backup_directory.glob('db-*.sq3'))
+
+    def run_once(self):
+        backup = self.backup()
+        logging.info('Database is backed up to %s', backup)
+        if self._archive_after_years:
+            before = datetime.now() - timedelta(days=365 * self._archive_after_years)
+            moved = self._database.archive_payments(before, self._archive_path)
+            logging.info('%d payments made before %s are archived to %s', moved, before, self._archive_path)
+        self._database.optimize()
+        logging.info('Database is optimized')
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logging.exception('Database maintenance failed')
+            self._stopped.wait(self._interval.total_seconds())
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
@@ -0,0 +1,233 @@
+import argparse
+import logging
+import sqlite3
+import time
+from contextlib import closing
+from typing import Callable, List, NamedTuple
+
+from configuration import Configuration
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection, Configuration], None]
+
+
+class MigrationReport(NamedTuple):
+    version: int
+    description: str
+    seconds: float
+
+
+def rewrite_in_batches(connection: sqlite3.Connection, table: str, assignments: str, batch_size: int = 10000):
+    """Runs "UPDATE table SET assignments" over consecutive rowid ranges of at most batch_size rows, so that large
+    tables are rewritten with bounded statement work (and progress) instead of in a single statement."""
+    low, high = connection.execute(f'SELECT MIN(rowid), MAX(rowid) FROM "{table}"').fetchone()
+    if low is None:
+        return
+    for start in range(low, high + 1, batch_size):
+        connection.execute(f'UPDATE "{table}" SET {assignments} WHERE rowid BETWEEN :start AND :end',
+                           {'start': start, 'end': start + batch_size - 1})
+
+
+def _get_columns(connection: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in connection.execute(f'PRAGMA table_info("{table}")')]
+
+
+# Databases created before the migrations were introduced have user_version 0 but may already contain some of the
+# tables, so every step is written to be a no-op for the parts which already exist.
+
+def _initial_schema(connection: sqlite3.Connection, configuration: Configuration):
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS "users" (
+            "id"   INTEGER,
+            "name" TEXT NOT NULL,
+            PRIMARY KEY("id")
+        );
+    """)
+    if not connection.execute('SELECT 1 FROM users').fetchone():
+        connection.executemany('INSERT INTO users (name) VALUES (?)', [(n,) for n in configuration.get_usernames()])
+
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS "wallets" (
+            "id"   INTEGER,
+            "wallet" TEXT NOT NULL,
+            PRIMARY KEY("id")
+        );
+    """)
+    if not connection.execute('SELECT 1 FROM wallets').fetchone():
+        connection.executemany('INSERT INTO wallets (wallet) VALUES (?)', [(w,) for w in configuration.get_currencies()])
+
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS "payments" (
+            "id"        INTEGER,
+            "payer_id"  INTEGER,
+            "amount"    INTEGER NOT NULL,
+            "wallet_id" INTEGER,
+            "note"      TEXT NOT NULL,
+            "dt"        TEXT NOT NULL,
+            PRIMARY KEY("id"),
+            FOREIGN KEY("payer_id") REFERENCES users("id"),
+            FOREIGN KEY("wallet_id") REFERENCES wallets("id")
+        );
+    """)
+
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS "balances" (
+            "id"        INTEGER,
+            "user_id"   INTEGER,
+            "balance"   INTEGER,
+            "wallet_id" INTEGER,
+            PRIMARY KEY("id"),
+            FOREIGN KEY("user_id") REFERENCES users("id"),
+            FOREIGN KEY("wallet_id") REFERENCES wallet("id")
+        );
+    """)
+
+
+def _recurring_payments(connection: sqlite3.Connection, _configuration: Configuration):
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS "recurring" (
+            "id"        INTEGER,
+            "payer_id"  INTEGER,
+            "amount"    INTEGER NOT NULL,
+            "wallet_id" INTEGER,
+            "note"      TEXT NOT NULL,
+            "period"    TEXT NOT NULL,
+            "start"     TEXT NOT NULL,
+            "next_due"  TEXT NOT NULL,
+            PRIMARY KEY("id"),
+            FOREIGN KEY("payer_id") REFERENCES users("id"),
+            FOREIGN KEY("wallet_id") REFERENCES wallets("id")
+        );
+    """)
+
+
+def _snapshots(connection: sqlite3.Connection, _configuration: Configuration):
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS "snapshots" (
+            "id"         INTEGER,
+            "payment_id" INTEGER NOT NULL,
+            "wallet_id"  INTEGER NOT NULL,
+            "user_id"    INTEGER NOT NULL,
+            "balance"    INTEGER NOT NULL,
+            "dt"         TEXT NOT NULL,
+            PRIMARY KEY("id"),
+            FOREIGN KEY("payment_id") REFERENCES payments("id"),
+            FOREIGN KEY("user_id") REFERENCES users("id"),
+            FOREIGN KEY("wallet_id") REFERENCES wallets("id")
+        );
+    """)
+    connection.execute('CREATE INDEX IF NOT EXISTS "snapshots_wallet_dt" ON "snapshots" ("wallet_id", "dt")')
+    connection.execute('CREATE INDEX IF NOT EXISTS "payments_wallet_id" ON "payments" ("wallet_id", "id")')
+    connection.execute('CREATE INDEX IF NOT EXISTS "payments_dt" ON "payments" ("dt")')
+
+
+def _payment_corrections(connection: sqlite3.Connection, _configuration: Configuration):
+    # Corrections are written as new payments linked to the payment they reverse or replace
+    columns = _get_columns(connection, 'payments')
+    if 'reverses_id' not in columns:
+        connection.execute('ALTER TABLE "payments" ADD COLUMN "reverses_id" INTEGER REFERENCES payments("id")')
+    if 'replaces_id' not in columns:
+        connection.execute('ALTER TABLE "payments" ADD COLUMN "replaces_id" INTEGER REFERENCES payments("id")')
+    connection.execute('CREATE INDEX IF NOT EXISTS "payments_reverses_id" ON "payments" ("reverses_id")')
+    connection.execute('CREATE INDEX IF NOT EXISTS "payments_replaces_id" ON "payments" ("replaces_id")')
+
+
+def _round_amounts(connection: sqlite3.Connection, _configuration: Configuration):
+    # Amounts are entered with at most two decimals, drop the floating point noise accumulated in the stored values
+    for table, column in (('payments', 'amount'), ('recurring', 'amount'), ('balances', 'balance'),
+                          ('snapshots', 'balance')):
+        rewrite_in_batches(connection, table, f'"{column}" = ROUND("{column}", 2)')
+
+
+def _monthly_spending(connection: sqlite3.Connection, _configuration: Configuration):
+    # Running total of the payments of every wallet per month, checked against the budgets on every write
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS "monthly_spending" (
+            "wallet_id" INTEGER NOT NULL,
+            "month"     TEXT NOT NULL,
+            "amount"    INTEGER NOT NULL,
+            PRIMARY KEY("wallet_id", "month"),
+            FOREIGN KEY("wallet_id") REFERENCES wallets("id")
+        );
+    """)
+    connection.execute('INSERT OR IGNORE INTO "monthly_spending" ("wallet_id", "month", "amount") '
+                       'SELECT "wallet_id", SUBSTR("dt", 1, 7), ROUND(SUM("amount"), 2) FROM "payments" '
+                       'GROUP BY "wallet_id", SUBSTR("dt", 1, 7)')
+
+
+MIGRATIONS = [
+    Migration(1, 'Create the users, wallets, payments and balances tables', _initial_schema),
+    Migration(2, 'Add the recurring payments table', _recurring_payments),
+    Migration(3, 'Add the balance snapshots table and the payments indexes', _snapshots),
+    Migration(4, 'Link the payment corrections to the corrected payments', _payment_corrections),
+    Migration(5, 'Round the stored amounts to cents', _round_amounts),
+    Migration(6, 'Add the monthly spending of the wallets', _monthly_spending),
+]
+
+
+class Migrator:
+    """Brings the schema of a database up to date, tracking the applied migrations in PRAGMA user_version.
+
+    Each migration runs in its own transaction together with the version bump, so a failing migration leaves the
+    database at the previous version without losing any data.
+    """
+
+    def __init__(self, database_path: str, configuration: Configuration, migrations: List[Migration] = None):
+        self._database_path = database_path
+        self._configuration = configuration
+        self._migrations = sorted(migrations if migrations is not None else MIGRATIONS, key=lambda m: m.version)
+
+    def get_version(self) -> int:
+        with closing(sqlite3.connect(self._database_path)) as connection:
+            return connection.execute('PRAGMA user_version').fetchone()[0]
+
+    def migrate(self, dry_run: bool = False) -> List[MigrationReport]:
+        """Applies the pending migrations and reports how long each one took. With dry_run, every migration is rolled
+        back after running, so the report shows what would be applied without changing the database."""
+        reports = []
+        with closing(sqlite3.connect(self._database_path, isolation_level=None)) as connection:
+            version = connection.execute('PRAGMA user_version').fetchone()[0]
+            # A dry run applies all the migrations in one transaction, which is rolled back at the end
+            if dry_run:
+                connection.execute('BEGIN IMMEDIATE')
+            for migration in self._migrations:
+                if migration.version <= version:
+                    continue
+                start = time.perf_counter()
+                if not dry_run:
+                    connection.execute('BEGIN IMMEDIATE')
+                try:
+                    migration.apply(connection, self._configuration)
+                    connection.execute(f'PRAGMA user_version = {int(migration.version)}')
+                except Exception as e:
+                    connection.execute('ROLLBACK')
+                    raise RuntimeError(f'Unable to apply the migration {migration.version} '
+                                       f'({migration.description}): {e}') from e
+                if not dry_run:
+                    connection.execute('COMMIT')
+                reports.append(MigrationReport(migration.version, migration.description, time.perf_counter() - start))
+            if dry_run:
+                connection.execute('ROLLBACK')
+        return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Applies the pending migrations of the database.')
+    parser.add_argument('database', help='path of the database, e.g. volumes/db.sq3')
+    parser.add_argument('config', help='path of the configuration, e.g. volumes/config.json')
+    parser.add_argument('--dry-run', action='store_true', help='roll back instead of committing the migrations')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    migrator = Migrator(args.database, Configuration(args.config, logging))
+    logging.info('Current version: %d', migrator.get_version())
+    for report in migrator.migrate(dry_run=args.dry_run):
+        logging.info('%d. %s: %.3f s', report.version, report.description, report.seconds)
+    logging.info('Version after migrating: %d', migrator.get_version())
+
+
+if __name__ == '__main__':
+    main()
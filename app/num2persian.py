@@ -1,5 +1,9 @@
 def to_persian(toman_number: str) -> str:
-    inputN = toman_number
+    return f'{to_words(toman_number)} تومان'
+
+
+def to_words(number: str) -> str:
+    inputN = number
     result = ""
 
     if "-" in inputN:
@@ -12,8 +16,7 @@ def to_persian(toman_number: str) -> str:
     intN = int(inputN)
 
     if intN > 10**61:
-        print("خطا: عدد مورد نظر شما خارج از محدوده مشخص شده برای این برنامه میباشد.")
-        quit()
+        raise ValueError("خطا: عدد مورد نظر شما خارج از محدوده مشخص شده برای این برنامه میباشد.")
 
     yekan = ["", "یک", "دو", "سه", "چهار", "پنج", "شش", "هفت", "هشت", "نه"]
     dahha = ["ده", "یازده", "دوازده", "سیزده", "چهارده", "پانزده", "شانزده", "هفده", "هجده", "نوزده"]
@@ -262,4 +265,4 @@ def to_persian(toman_number: str) -> str:
     if tahezarNi > 0:
         result += tahezarNs
 
-    return f'{result} تومان'
+    return result
@@ -1,12 +1,17 @@
 from __future__ import annotations
 
 import json
-from typing import List
+from datetime import datetime
+from io import StringIO
+from json.encoder import encode_basestring_ascii
+from typing import Iterable, TextIO
 
-import num2persian
+from localization import Locale, get_default_locale
 
 
 class Payment:
+    __slots__ = ('payer', 'amount', 'wallet', 'wallet_symbol', 'note')
+
     def __init__(self, payer: str, amount: str, wallet: str, wallet_symbol: str, note: str):
         self.payer = payer
         self.amount = amount
@@ -14,19 +19,12 @@ class Payment:
         self.wallet_symbol = wallet_symbol
         self.note = note
 
-    def format(self) -> str:
-        result = f'Payer: {self.payer}\n' \
-                 f'Amount: {self.amount} {self.wallet_symbol}\n'
-        # TODO: workaround for having Persian amount of payment
-        if self.wallet == 'Toman':
-            try:
-                persian_amount = num2persian.to_persian(self.amount)
-                result += f'Amount: {persian_amount}\n'
-            except ValueError:
-                pass
-        result += f'Wallet: {self.wallet}\n' \
-                  f'Note: {self.note}\n'
-        return result
+    def format(self, locale: Locale = None) -> str:
+        locale = locale or get_default_locale()
+        words = locale.spell(self.wallet, self.amount)
+        return locale.get('payment', payer=self.payer, amount=locale.format_number(self.amount),
+                          symbol=self.wallet_symbol, words=locale.get('payment.words', words=words) if words else '',
+                          wallet=self.wallet, note=self.note)
 
     def jsonify(self):
         return json.dumps({'payer': self.payer, 'wallet': self.wallet, 'amount': self.amount, 'note': self.note})
@@ -36,20 +34,62 @@ class Payment:
 
 
 class PersistedPayment(Payment):
-    def __init__(self, payer: str, amount: str, wallet: str, wallet_symbol: str, note: str, date):
+    __slots__ = ('date', 'id')
+
+    def __init__(self, payer: str, amount: str, wallet: str, wallet_symbol: str, note: str, date, id_: int = None):
         super().__init__(payer, amount, wallet, wallet_symbol, note)
         self.date = date
+        self.id = id_
+
+    def format(self, locale: Locale = None) -> str:
+        locale = locale or get_default_locale()
+        result = locale.get('payment.date', payment=super().format(locale), date=locale.format_date(self.date))
+        return result if self.id is None else locale.get('payment.id', id=self.id, payment=result)
 
-    def format(self) -> str:
-        return f'{super().format()}Date: {self.date}\n'
+    @staticmethod
+    def jsonify_all(payments: Iterable[PersistedPayment]) -> str:
+        buffer = StringIO()
+        PersistedPayment.dump_all(payments, buffer)
+        return buffer.getvalue()
 
     @staticmethod
-    def jsonify_all(payments: List[PersistedPayment]) -> str:
-        result = {'payments': []}
+    def dump_all(payments: Iterable[PersistedPayment], fp: TextIO):
+        # Streams the same document as json.dumps({'payments': [...]}, indent=4) without building it in memory
+        enc = encode_basestring_ascii
+        fp.write('{\n    "payments": [')
+        separator = '\n'
         for payment in payments:
-            result['payments'].append({'payer': payment.payer, 'amount': f'{payment.amount} {payment.wallet_symbol}',
-                                       'wallet': payment.wallet, 'note': payment.note, 'datetime': payment.date})
-        return json.dumps(result, indent=4)
+            fp.write(f'{separator}        {{\n'
+                     f'            "payer": {enc(payment.payer)},\n'
+                     f'            "amount": {enc(f"{payment.amount} {payment.wallet_symbol}")},\n'
+                     f'            "wallet": {enc(payment.wallet)},\n'
+                     f'            "note": {enc(payment.note)},\n'
+                     f'            "datetime": {enc(payment.date)}\n'
+                     f'        }}')
+            separator = ',\n'
+        fp.write('\n    ]\n}' if separator != '\n' else ']\n}')
+
+    def __repr__(self):
+        return f'PersistedPayment ({self.payer!r}, {self.amount!r}, {self.wallet!r}, {self.wallet_symbol!r}, {self.note!r}, ' \
+               f'{self.date!r}, {self.id!r})'
+
+
+class RecurringPayment(Payment):
+    __slots__ = ('id', 'period', 'start', 'next_due')
+
+    def __init__(self, id_: int, payer: str, amount: str, wallet: str, wallet_symbol: str, note: str, period: str,
+                 start: datetime, next_due: datetime):
+        super().__init__(payer, amount, wallet, wallet_symbol, note)
+        self.id = id_
+        self.period = period
+        self.start = start
+        self.next_due = next_due
+
+    def format(self, locale: Locale = None) -> str:
+        locale = locale or get_default_locale()
+        return locale.get('payment.recurring', id=self.id, payment=super().format(locale), period=self.period,
+                          next_due=locale.format_datetime(self.next_due, seconds=False))
 
     def __repr__(self):
-        return f'PersistedPayment ({self.payer!r}, {self.amount!r}, {self.wallet!r}, {self.wallet_symbol!r}, {self.note!r}, {self.date!r})'
+        return f'RecurringPayment ({self.id!r}, {self.payer!r}, {self.amount!r}, {self.wallet!r}, {self.wallet_symbol!r}, ' \
+               f'{self.note!r}, {self.period!r}, {self.start!r}, {self.next_due!r})'
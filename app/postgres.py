@@ -0,0 +1,156 @@
+import sys
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from alerts import Alert, AlertRules
+from configuration import Configuration
+from ledger import apply_payment, from_signed, to_signed
+from payment import Payment, PersistedPayment
+from storage import Storage, normalize_amount
+
+try:
+    from psycopg_pool import ConnectionPool
+except ImportError:
+    ConnectionPool = None
+
+PAYMENTS_QUERY = 'SELECT payments.id, users.name, amount, wallets.wallet, note, dt FROM payments ' \
+                 'JOIN users ON payments.payer_id = users.id ' \
+                 'JOIN wallets ON payments.wallet_id = wallets.id '
+
+
+class PostgresStorage(Storage):
+    """Stores the ledger in a PostgreSQL server, so that several bot replicas can share it.
+
+    Connections come from a thread-safe pool. The balance row of a wallet is locked (SELECT ... FOR UPDATE) while a
+    payment is applied, so concurrent writers are serialized per wallet.
+    """
+
+    def __init__(self, configuration: Configuration, dsn: str, pool_size: int = 4, migrate: bool = True):
+        if ConnectionPool is None:
+            raise RuntimeError('The postgres storage requires the psycopg[pool] package')
+        self._configuration = configuration
+        self._alert_rules = AlertRules.from_configuration(configuration)
+        self._pool = ConnectionPool(dsn, min_size=1, max_size=pool_size, open=True)
+        if migrate:
+            self._initialize()
+
+    def _initialize(self):
+        with self._pool.connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS users ('
+                               'id SERIAL PRIMARY KEY, name TEXT NOT NULL UNIQUE)')
+            connection.execute('CREATE TABLE IF NOT EXISTS wallets ('
+                               'id SERIAL PRIMARY KEY, wallet TEXT NOT NULL UNIQUE)')
+            connection.execute('CREATE TABLE IF NOT EXISTS payments ('
+                               'id BIGSERIAL PRIMARY KEY, '
+                               'payer_id INTEGER NOT NULL REFERENCES users(id), '
+                               'amount DOUBLE PRECISION NOT NULL, '
+                               'wallet_id INTEGER NOT NULL REFERENCES wallets(id), '
+                               'note TEXT NOT NULL, '
+                               'dt TEXT NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS balances ('
+                               'wallet_id INTEGER PRIMARY KEY REFERENCES wallets(id), '
+                               'user_id INTEGER NOT NULL REFERENCES users(id), '
+                               'balance DOUBLE PRECISION NOT NULL)')
+            # Running total of the payments of every wallet per month, filled from the existing payments once
+            if connection.execute("SELECT to_regclass('monthly_spending')").fetchone()[0] is None:
+                connection.execute('CREATE TABLE monthly_spending ('
+                                   'wallet_id INTEGER NOT NULL REFERENCES wallets(id), '
+                                   'month TEXT NOT NULL, '
+                                   'amount DOUBLE PRECISION NOT NULL, '
+                                   'PRIMARY KEY (wallet_id, month))')
+                connection.execute('INSERT INTO monthly_spending (wallet_id, month, amount) '
+                                   'SELECT wallet_id, SUBSTR(dt, 1, 7), ROUND(SUM(amount)::NUMERIC, 2) FROM payments '
+                                   'GROUP BY wallet_id, SUBSTR(dt, 1, 7)')
+            # Counter of the writes, incremented in the same transaction as the balance it reports
+            connection.execute('CREATE TABLE IF NOT EXISTS ledger_version ('
+                               'id INTEGER PRIMARY KEY CHECK (id = 1), version BIGINT NOT NULL)')
+            connection.execute('INSERT INTO ledger_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING')
+            for name in self._configuration.get_usernames():
+                connection.execute('INSERT INTO users (name) VALUES (%s) ON CONFLICT (name) DO NOTHING', (name,))
+            for wallet in self._configuration.get_currencies():
+                connection.execute('INSERT INTO wallets (wallet) VALUES (%s) ON CONFLICT (wallet) DO NOTHING', (wallet,))
+
+    def close(self):
+        self._pool.close()
+
+    def write_transaction(self, payment: Payment) -> List[Alert]:
+        reference, other = self._configuration.get_usernames()
+        amount = float(payment.amount)
+        now = datetime.now()
+        try:
+            with self._pool.connection() as connection, connection.transaction():
+                connection.execute('INSERT INTO payments (payer_id, amount, wallet_id, note, dt) VALUES ('
+                                   '(SELECT id FROM users WHERE name = %(payer)s), %(amount)s, '
+                                   '(SELECT id FROM wallets WHERE wallet = %(wallet)s), %(note)s, %(dt)s)',
+                                   {'payer': payment.payer, 'amount': amount, 'wallet': payment.wallet,
+                                    'note': payment.note, 'dt': now.strftime('%Y-%m-%d %H:%M:%S')})
+                spent = connection.execute('INSERT INTO monthly_spending (wallet_id, month, amount) VALUES ('
+                                           '(SELECT id FROM wallets WHERE wallet = %(wallet)s), %(month)s, %(amount)s) '
+                                           'ON CONFLICT (wallet_id, month) DO UPDATE '
+                                           'SET amount = ROUND((monthly_spending.amount + EXCLUDED.amount)::NUMERIC, 2) '
+                                           'RETURNING amount',
+                                           {'wallet': payment.wallet, 'month': f'{now:%Y-%m}', 'amount': amount}
+                                           ).fetchone()[0]
+                # Make sure the balance row exists, then lock it for the read-modify-write
+                connection.execute('INSERT INTO balances (wallet_id, user_id, balance) VALUES ('
+                                   '(SELECT id FROM wallets WHERE wallet = %(wallet)s), '
+                                   '(SELECT id FROM users WHERE name = %(payer)s), 0) ON CONFLICT (wallet_id) DO NOTHING',
+                                   {'wallet': payment.wallet, 'payer': payment.payer})
+                balance, creditor = connection.execute('SELECT balance, users.name FROM balances '
+                                                       'JOIN users ON balances.user_id = users.id '
+                                                       'WHERE wallet_id = (SELECT id FROM wallets WHERE wallet = %s) '
+                                                       'FOR UPDATE OF balances', (payment.wallet,)).fetchone()
+                signed = apply_payment(to_signed(creditor, balance, reference), payment.payer, amount, reference)
+                new_balance, new_creditor = from_signed(signed, reference, other)
+                connection.execute('UPDATE balances SET balance = %(balance)s, '
+                                   'user_id = (SELECT id FROM users WHERE name = %(creditor)s) '
+                                   'WHERE wallet_id = (SELECT id FROM wallets WHERE wallet = %(wallet)s)',
+                                   {'balance': new_balance, 'creditor': new_creditor, 'wallet': payment.wallet})
+                # Last, so that the row lock serializing the writers is held as briefly as possible
+                connection.execute('UPDATE ledger_version SET version = version + 1 WHERE id = 1')
+            return self._alert_rules.evaluate(payment.wallet, (round(spent - amount, 2), spent), (balance, new_balance))
+        except Exception:
+            raise RuntimeError(f'Unable to write the payment to the database: {payment}')
+
+    def get_balance(self, wallet: str) -> Optional[Tuple[str, str]]:
+        with self._pool.connection() as connection:
+            row = connection.execute('SELECT balance, users.name FROM balances '
+                                     'JOIN users ON balances.user_id = users.id '
+                                     'WHERE wallet_id = (SELECT id FROM wallets WHERE wallet = %s)', (wallet,)).fetchone()
+        if row:
+            return str(round(normalize_amount(row[0]), 2)), row[1]
+
+    def get_balances(self) -> Dict[str, Tuple[float, str]]:
+        with self._pool.connection() as connection:
+            rows = connection.execute('SELECT wallets.wallet, balance, users.name FROM balances '
+                                      'JOIN users ON balances.user_id = users.id '
+                                      'JOIN wallets ON balances.wallet_id = wallets.id').fetchall()
+        return {wallet: (normalize_amount(balance), username) for wallet, balance, username in rows}
+
+    def _to_payment(self, row: tuple, symbols: Dict[str, str]) -> PersistedPayment:
+        payment_id, payer, amount, wallet, note, dt = row
+        wallet = sys.intern(wallet)
+        symbol = symbols.get(wallet)
+        if symbol is None:
+            symbol = symbols[wallet] = sys.intern(self._configuration.get_wallet_symbol(wallet))
+        return PersistedPayment(sys.intern(payer), str(normalize_amount(amount)), wallet, symbol, note, dt, payment_id)
+
+    def iter_payments(self) -> Iterator[PersistedPayment]:
+        symbols = {}
+        with self._pool.connection() as connection:
+            # A named cursor is server-side, so the rows are streamed instead of fetched at once
+            with connection.cursor(name='iter_payments') as cursor:
+                cursor.execute(PAYMENTS_QUERY + 'ORDER BY payments.id')
+                for row in cursor:
+                    yield self._to_payment(row, symbols)
+
+    def get_last_payments(self, count: int) -> List[PersistedPayment]:
+        symbols = {}
+        with self._pool.connection() as connection:
+            rows = connection.execute(PAYMENTS_QUERY + 'ORDER BY payments.id DESC LIMIT %s', (count,)).fetchall()
+        return [self._to_payment(row, symbols) for row in reversed(rows)]
+
+    def get_version(self) -> int:
+        # Unlike the payment IDs, which are taken before the balance is locked, the counter follows the commit order
+        with self._pool.connection() as connection:
+            return connection.execute('SELECT version FROM ledger_version WHERE id = 1').fetchone()[0]
@@ -0,0 +1,72 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class TokenBucket:
+    """Holds up to "capacity" tokens, refilled continuously at "refill_per_second"."""
+
+    def __init__(self, capacity: float, refill_per_second: float, now: Callable[[], float] = time.monotonic):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._now = now
+        self._tokens = capacity
+        self._updated = now()
+
+    def consume(self, cost: float) -> Optional[float]:
+        """Takes "cost" tokens, or returns the seconds to wait until they are available without taking any."""
+        now = self._now()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+        if cost <= self._tokens:
+            self._tokens -= cost
+            return None
+        return (cost - self._tokens) / self.refill_per_second
+
+
+class RateLimiter:
+    """One token bucket per user, charged by the cost of each command (1 for the commands without a configured cost
+    and for the other updates, e.g. the answers of a conversation)."""
+
+    def __init__(self, capacity: float, refill_per_second: float, costs: Dict[str, float] = None,
+                 now: Callable[[], float] = time.monotonic):
+        for command, cost in (costs or {}).items():
+            if cost > capacity:
+                raise ValueError(f'Cost of /{command} exceeds the capacity of the rate limiter: {cost} > {capacity}')
+        self._capacity = capacity
+        self._refill_per_second = refill_per_second
+        self._costs = costs or {}
+        self._now = now
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+
+    def get_cost(self, command: Optional[str]) -> float:
+        return self._costs.get(command, 1)
+
+    def acquire(self, user: Hashable, command: Optional[str]) -> Optional[float]:
+        """Charges the user for the command, or returns the seconds to wait if the user is over the limit."""
+        bucket = self._buckets.get(user)
+        if bucket is None:
+            bucket = self._buckets[user] = TokenBucket(self._capacity, self._refill_per_second, self._now)
+        return bucket.consume(self.get_cost(command))
+
+
+class Coalescer:
+    """Runs one call per key at a time: the callers arriving while it runs share its result instead of running it
+    again."""
+
+    def __init__(self):
+        self._running: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        future = self._running.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._running[key] = future
+            future.add_done_callback(lambda _: self._running.pop(key, None))
+        else:
+            self.coalesced += 1
+        # A caller giving up should not cancel the call shared with the others
+        return await asyncio.shield(future)
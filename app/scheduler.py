@@ -0,0 +1,109 @@
+import asyncio
+import calendar
+import heapq
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from payment import RecurringPayment
+
+PERIODS = ('daily', 'weekly', 'monthly')
+
+# Upper bound of a single sleep, so that wall-clock jumps (e.g. suspend or NTP) are picked up without polling
+MAX_SLEEP_SECONDS = 3600
+
+# A failed occurrence is retried after RETRY_SECONDS, doubled after every failure up to MAX_RETRY_SECONDS
+RETRY_SECONDS = 30
+MAX_RETRY_SECONDS = 3600
+
+
+def _add_months(dt: datetime, months: int) -> datetime:
+    month_index = dt.month - 1 + months
+    year, month = dt.year + month_index // 12, month_index % 12 + 1
+    return dt.replace(year=year, month=month, day=min(dt.day, calendar.monthrange(year, month)[1]))
+
+
+def next_occurrence(period: str, start: datetime, after: datetime) -> datetime:
+    """Returns the first occurrence of the schedule (start, start + period, ...) which is strictly after "after"."""
+    if period == 'monthly':
+        months = max(0, (after.year - start.year) * 12 + after.month - start.month)
+        candidate = _add_months(start, months)
+        while candidate <= after:
+            months += 1
+            candidate = _add_months(start, months)
+        return candidate
+    if period == 'daily':
+        step = timedelta(days=1)
+    elif period == 'weekly':
+        step = timedelta(weeks=1)
+    else:
+        raise ValueError(f'Unknown period: {period}')
+    if after < start:
+        return start
+    return start + step * ((after - start) // step + 1)
+
+
+class Scheduler:
+    """Fires recurring payments when they are due.
+
+    Schedules are kept in a min-heap keyed by their next due time, so finding the next one is O(log n) and the
+    runner sleeps exactly until then. Removed or rescheduled entries are dropped lazily when they reach the top.
+    Schedules that were missed (e.g. while the bot was down) are fired once per missed occurrence. An occurrence
+    whose callback fails is retried with a backoff, and the schedule is only moved past it once the callback succeeds.
+    """
+
+    def __init__(self, callback: Callable[[RecurringPayment, datetime], Awaitable[None]],
+                 now: Callable[[], datetime] = datetime.now):
+        self._callback = callback
+        self._now = now
+        # (fire time, schedule ID, due time) entries, fired at their due time unless they are retried
+        self._heap: List[Tuple[datetime, int, datetime]] = []
+        self._schedules: Dict[int, RecurringPayment] = {}
+        self._failures: Dict[int, int] = {}
+        self._wakeup = asyncio.Event()
+
+    def add(self, schedule: RecurringPayment):
+        self._schedules[schedule.id] = schedule
+        self._failures.pop(schedule.id, None)
+        heapq.heappush(self._heap, (schedule.next_due, schedule.id, schedule.next_due))
+        self._wakeup.set()
+
+    def remove(self, schedule_id: int):
+        self._schedules.pop(schedule_id, None)
+        self._failures.pop(schedule_id, None)
+
+    def __len__(self):
+        return len(self._schedules)
+
+    async def _fire_due(self):
+        while self._heap and self._heap[0][0] <= self._now():
+            _, schedule_id, due = heapq.heappop(self._heap)
+            schedule = self._schedules.get(schedule_id)
+            if schedule is None or schedule.next_due != due:
+                continue
+            # The callback persists the occurrence along with the next due time of the schedule
+            schedule.next_due = next_occurrence(schedule.period, schedule.start, due)
+            try:
+                await self._callback(schedule, due)
+            except Exception:
+                failures = self._failures[schedule_id] = self._failures.get(schedule_id, 0) + 1
+                delay = min(RETRY_SECONDS * 2 ** (failures - 1), MAX_RETRY_SECONDS)
+                logging.exception('Unable to run the recurring payment %s due at %s, retrying in %d s', schedule_id,
+                                  due, delay)
+                schedule.next_due = due
+                heapq.heappush(self._heap, (self._now() + timedelta(seconds=delay), schedule_id, due))
+                continue
+            self._failures.pop(schedule_id, None)
+            heapq.heappush(self._heap, (schedule.next_due, schedule_id, schedule.next_due))
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            await self._fire_due()
+            timeout = MAX_SLEEP_SECONDS
+            if self._heap:
+                timeout = min(timeout, max(0.0, (self._heap[0][0] - self._now()).total_seconds()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,53 @@
+import multiprocessing
+from multiprocessing.process import BaseProcess
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+
+def get_shard(chat_id: int, shards: int, chat_ids: Sequence[int] = ()) -> int:
+    # The known chats are spread by their index, so that e.g. two chats always get their own worker of two, whatever
+    # their IDs. The other chats fall back to their ID
+    if chat_id in chat_ids:
+        return list(chat_ids).index(chat_id) % shards
+    return chat_id % shards
+
+
+class ShardedDispatcher:
+    """Runs "target(index, updates, *args)" in one worker process per shard, and forwards every update to the worker
+    of its chat, so that the conversations of a chat always stay in the same worker. The given chat IDs, e.g. the
+    configured ones, are spread evenly between the workers.
+
+    The workers are spawned, i.e. they start from a fresh interpreter instead of a copy of this process with its
+    threads and database connections. They receive the updates as dicts from their queue, and None to stop.
+    """
+
+    def __init__(self, workers: int, target: Callable, args: tuple = (), chat_ids: Sequence[int] = ()):
+        if workers < 1:
+            raise ValueError(f'Invalid number of workers: {workers}')
+        context = multiprocessing.get_context('spawn')
+        self._queues = [context.Queue() for _ in range(workers)]
+        self._processes: List[BaseProcess] = [
+            context.Process(target=target, args=(index, queue, *args), name=f'worker-{index}', daemon=True)
+            for index, queue in enumerate(self._queues)]
+        self._shards = {chat_id: get_shard(chat_id, workers, chat_ids) for chat_id in chat_ids}
+        self.forwarded = [0] * workers
+
+    def start(self):
+        for process in self._processes:
+            process.start()
+
+    def forward(self, chat_id: int, update: Dict[str, Any]):
+        shard = self._shards.get(chat_id)
+        if shard is None:
+            shard = get_shard(chat_id, len(self._queues))
+        self._queues[shard].put(update)
+        self.forwarded[shard] += 1
+
+    def stop(self, timeout: Optional[float] = 30):
+        """Lets the workers finish their pending updates, and kills the ones which do not stop in time."""
+        for queue in self._queues:
+            queue.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
@@ -0,0 +1,122 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from alerts import Alert, AlertRules
+from configuration import Configuration
+from ledger import apply_payment, from_signed
+from payment import Payment, PersistedPayment
+
+
+class Storage(ABC):
+    """Ledger storage: the payments and the running balance of every wallet.
+
+    The balance of a wallet is reported as its creditor together with the non-negative amount the other user owes.
+    """
+
+    # Whether the other processes opening the same storage see the same ledger, e.g. the worker processes
+    shared = True
+
+    @abstractmethod
+    def write_transaction(self, payment: Payment) -> List[Alert]:
+        """Stores the payment and updates the balance of its wallet atomically, and returns the alerts it fired."""
+
+    @abstractmethod
+    def get_balance(self, wallet: str) -> Optional[Tuple[str, str]]:
+        """Returns the formatted balance and the creditor of the wallet, or None if it has no payments."""
+
+    @abstractmethod
+    def get_balances(self) -> Dict[str, Tuple[float, str]]:
+        """Returns the balance and the creditor of all the wallets with payments."""
+
+    @abstractmethod
+    def iter_payments(self) -> Iterator[PersistedPayment]:
+        """Streams all the payments in the order they were written."""
+
+    def get_payments(self) -> List[PersistedPayment]:
+        return list(self.iter_payments())
+
+    @abstractmethod
+    def get_last_payments(self, count: int) -> List[PersistedPayment]:
+        """Returns the last "count" payments in the order they were written."""
+
+    @abstractmethod
+    def get_version(self) -> int:
+        """Returns a number which changes whenever the ledger is written, e.g. to invalidate cached balances."""
+
+
+def normalize_amount(amount: float):
+    # Matches how SQLite stores amounts in INTEGER columns: integral values come back as int
+    return int(amount) if amount == int(amount) else amount
+
+
+class MemoryStorage(Storage):
+    """Keeps the ledger in memory, for tests and benchmarks."""
+
+    shared = False
+
+    def __init__(self, configuration: Configuration):
+        self._configuration = configuration
+        self._payments: List[PersistedPayment] = []
+        # Signed balance of every wallet, positive when the first configured user is the creditor
+        self._balances: Dict[str, float] = {}
+        # Spending of every wallet per month, e.g. ('Dollar', '2023-01')
+        self._monthly_spending: Dict[Tuple[str, str], float] = {}
+        self._alert_rules = AlertRules.from_configuration(configuration)
+        self._write_lock = threading.Lock()
+        self._version = 0
+
+    def write_transaction(self, payment: Payment) -> List[Alert]:
+        reference, _ = self._configuration.get_usernames()
+        amount = normalize_amount(float(payment.amount))
+        now = datetime.now()
+        with self._write_lock:
+            debt = abs(self._balances.get(payment.wallet, 0))
+            self._balances[payment.wallet] = apply_payment(self._balances.get(payment.wallet, 0), payment.payer, amount,
+                                                           reference)
+            spent = self._monthly_spending.get((payment.wallet, f'{now:%Y-%m}'), 0)
+            self._monthly_spending[(payment.wallet, f'{now:%Y-%m}')] = round(spent + amount, 2)
+            self._payments.append(PersistedPayment(payment.payer, str(amount), payment.wallet, payment.wallet_symbol,
+                                                   payment.note, now.strftime('%Y-%m-%d %H:%M:%S'),
+                                                   len(self._payments) + 1))
+            self._version += 1
+            return self._alert_rules.evaluate(payment.wallet, (spent, round(spent + amount, 2)),
+                                              (debt, abs(self._balances[payment.wallet])))
+
+    def get_balances(self) -> Dict[str, Tuple[float, str]]:
+        return {wallet: from_signed(normalize_amount(signed), *self._configuration.get_usernames())
+                for wallet, signed in self._balances.items()}
+
+    def get_balance(self, wallet: str) -> Optional[Tuple[str, str]]:
+        if wallet in self._balances:
+            balance, creditor = self.get_balances()[wallet]
+            return str(round(balance, 2)), creditor
+
+    def iter_payments(self) -> Iterator[PersistedPayment]:
+        return iter(self._payments)
+
+    def get_last_payments(self, count: int) -> List[PersistedPayment]:
+        return self._payments[-count:] if count > 0 else []
+
+    def get_version(self) -> int:
+        return self._version
+
+
+def create_storage(configuration: Configuration, volumes_directory: str, migrate: bool = True) -> Storage:
+    """Creates the storage backend selected by the "storage" section of the configuration.
+
+    The schema is created or migrated unless "migrate" is False, i.e. when another process has already done it.
+    """
+    settings = configuration.get_storage()
+    backend = settings['backend']
+    if backend == 'sqlite':
+        from database import Database
+        return Database(configuration, settings.get('path') or os.path.join(volumes_directory, 'db.sq3'), migrate)
+    if backend == 'postgres':
+        from postgres import PostgresStorage
+        return PostgresStorage(configuration, settings['dsn'], settings.get('pool_size', 4), migrate)
+    if backend == 'memory':
+        return MemoryStorage(configuration)
+    raise ValueError(f'Unknown storage backend {backend}')
@@ -0,0 +1,24 @@
+import unittest
+
+from alerts import AlertRule, AlertRules
+
+
+class TestAlertRules(unittest.TestCase):
+
+    RULES = AlertRules([AlertRule('Dollar', 'budget', 100), AlertRule('Dollar', 'budget', 200),
+                        AlertRule('Dollar', 'imbalance', 50), AlertRule('Euro', 'budget', 10)])
+
+    # --------------evaluate()--------------
+    def test_evaluate(self):
+        alerts = self.RULES.evaluate('Dollar', (90, 250), (40, 60))
+        self.assertEqual([(100, 250), (200, 250), (50, 60)], [(a.rule.limit, a.value) for a in alerts])
+
+    def test_evaluate2(self):
+        # Should not fire again while staying over the limit, nor for reaching it exactly
+        self.assertEqual([], self.RULES.evaluate('Dollar', (110, 150), (60, 70)))
+        self.assertEqual([], self.RULES.evaluate('Dollar', (90, 100), (30, 50)))
+        self.assertEqual([], self.RULES.evaluate('Pound', (0, 1000), (0, 1000)))
+
+    def test_contains(self):
+        self.assertIn('Euro', self.RULES)
+        self.assertNotIn('Pound', self.RULES)
@@ -0,0 +1,47 @@
+import threading
+import unittest
+
+from cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    # --------------get_or_set()--------------
+    def test_get_or_set(self):
+        cache = LRUCache(2)
+        self.assertEqual('a', cache.get_or_set(1, lambda: 'a'))
+        self.assertEqual('a', cache.get_or_set(1, lambda: 'changed'))
+        self.assertEqual({'size': 1, 'maxsize': 2, 'hits': 1, 'misses': 1, 'evictions': 0}, cache.get_stats())
+
+    def test_get_or_set2(self):
+        # Should evict the least recently used entry
+        cache = LRUCache(2)
+        cache.get_or_set(1, lambda: 'a')
+        cache.get_or_set(2, lambda: 'b')
+        cache.get_or_set(1, lambda: 'a')
+        cache.get_or_set(3, lambda: 'c')
+        self.assertIn(1, cache)
+        self.assertNotIn(2, cache)
+        self.assertEqual(2, len(cache))
+        self.assertEqual(1, cache.get_stats()['evictions'])
+
+    def test_get_or_set3(self):
+        # Should stay consistent when shared by threads
+        cache = LRUCache(8)
+
+        def read():
+            for i in range(1000):
+                cache.get_or_set(i % 16, lambda: i % 16)
+
+        threads = [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = cache.get_stats()
+        self.assertEqual(8, stats['size'])
+        self.assertEqual(4000, stats['hits'] + stats['misses'])
+
+    def test_init(self):
+        with self.assertRaises(ValueError):
+            LRUCache(0)
@@ -186,3 +186,135 @@ class TestConfiguration(unittest.TestCase):
             non_existing_currency = 'NonExistingCurrency'
             with self.assertRaises(ValueError, msg=f'Unknown currency {non_existing_currency}'):
                 Configuration(cfg_json.name, logging).get_wallet_symbol(non_existing_currency)
+
+    # --------------get_wallet_words()--------------
+    def test_get_wallet_words(self):
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestConfiguration.VALID_CFG_JSON)
+            cfg_json.flush()
+            configuration = Configuration(cfg_json.name, logging)
+            self.assertIsNone(configuration.get_wallet_words('Dollar'))
+            self.assertEqual('fa', configuration.get_wallet_words('Toman'))
+
+    # --------------get_language()--------------
+    def test_get_language(self):
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestConfiguration.VALID_CFG_JSON)
+            cfg_json.flush()
+            configuration = Configuration(cfg_json.name, logging)
+            self.assertEqual('en', configuration.get_language(configuration.get_chat_ids()[0]))
+            with self.assertRaises(ValueError):
+                configuration.get_language(-1)
+
+    # --------------get_maintenance()--------------
+    def test_get_maintenance(self):
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestConfiguration.VALID_CFG_JSON)
+            cfg_json.flush()
+            self.assertEqual({'interval_hours': 24, 'backups': 7, 'archive_after_years': None},
+                             Configuration(cfg_json.name, logging).get_maintenance())
+
+    def test_get_maintenance2(self):
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestConfiguration.VALID_CFG_JSON[:-1] + ', "maintenance": {"archive_after_years": 3}}')
+            cfg_json.flush()
+            self.assertEqual(3, Configuration(cfg_json.name, logging).get_maintenance()['archive_after_years'])
+
+    def test_get_maintenance3(self):
+        # Should fail because of an invalid maintenance setting
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestConfiguration.VALID_CFG_JSON[:-1] + ', "maintenance": {"backups": 0}}')
+            cfg_json.flush()
+            with self.assertRaises(ConfigurationError) as cm:
+                Configuration(cfg_json.name, logging)
+            self.assertEqual('Configuration error: maintenance setting "backups" must be a positive integer.', str(cm.exception))
+
+    def test_get_maintenance4(self):
+        # Should fail because the number of backups is not an integer, unlike the interval
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestConfiguration.VALID_CFG_JSON[:-1] + ', "maintenance": {"backups": 2.5, "interval_hours": 0.5}}')
+            cfg_json.flush()
+            with self.assertRaises(ConfigurationError) as cm:
+                Configuration(cfg_json.name, logging)
+            self.assertEqual('Configuration error: maintenance setting "backups" must be a positive integer.', str(cm.exception))
+
+    # --------------get_rate_limit()--------------
+    def test_get_rate_limit(self):
+        # Configured costs should be added to the default ones
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestConfiguration.VALID_CFG_JSON[:-1] + ', "rate_limit": {"capacity": 5, "costs": {"last5": 2}}}')
+            cfg_json.flush()
+            self.assertEqual({'capacity': 5, 'refill_per_second': 0.5, 'costs': {'history': 10, 'status': 0.5, 'last5': 2}},
+                             Configuration(cfg_json.name, logging).get_rate_limit())
+
+    def test_get_rate_limit2(self):
+        # Should fail because of an invalid rate limit setting
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestConfiguration.VALID_CFG_JSON[:-1] + ', "rate_limit": {"refill_per_second": 0}}')
+            cfg_json.flush()
+            with self.assertRaises(ConfigurationError):
+                Configuration(cfg_json.name, logging)
+
+    # --------------get_alerts()--------------
+    def test_get_alerts(self):
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestConfiguration.VALID_CFG_JSON[:-1] +
+                           ', "alerts": [{"wallet": "Dollar", "type": "imbalance", "limit": 100}]}')
+            cfg_json.flush()
+            self.assertEqual([{'wallet': 'Dollar', 'type': 'imbalance', 'limit': 100}],
+                             Configuration(cfg_json.name, logging).get_alerts())
+
+    def test_get_alerts2(self):
+        # Should fail because of an unknown wallet
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestConfiguration.VALID_CFG_JSON[:-1] +
+                           ', "alerts": [{"wallet": "Pound", "type": "budget", "limit": 100}]}')
+            cfg_json.flush()
+            with self.assertRaises(ConfigurationError):
+                Configuration(cfg_json.name, logging)
+
+    # --------------get_workers()--------------
+    def test_get_workers(self):
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestConfiguration.VALID_CFG_JSON)
+            cfg_json.flush()
+            self.assertEqual(1, Configuration(cfg_json.name, logging).get_workers())
+
+    def test_get_workers2(self):
+        # Should be reduced to one worker per user
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestConfiguration.VALID_CFG_JSON[:-1] + ', "workers": 4}')
+            cfg_json.flush()
+            self.assertEqual(2, Configuration(cfg_json.name, logging).get_workers())
+
+    def test_get_workers3(self):
+        # Should fail because of an invalid number of workers
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestConfiguration.VALID_CFG_JSON[:-1] + ', "workers": 0}')
+            cfg_json.flush()
+            with self.assertRaises(ConfigurationError):
+                Configuration(cfg_json.name, logging)
+
+    # --------------get_storage()--------------
+    def test_get_storage(self):
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestConfiguration.VALID_CFG_JSON)
+            cfg_json.flush()
+            self.assertEqual({'backend': 'sqlite'}, Configuration(cfg_json.name, logging).get_storage())
+
+    def test_get_storage2(self):
+        # Should fail because the postgres storage has no DSN
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestConfiguration.VALID_CFG_JSON[:-1] + ', "storage": {"backend": "postgres"}}')
+            cfg_json.flush()
+            with self.assertRaises(ConfigurationError) as cm:
+                Configuration(cfg_json.name, logging)
+            self.assertEqual('Configuration error: "dsn" not defined for the postgres storage.', str(cm.exception))
+
+    def test_get_storage3(self):
+        # Should fail because the workers would not share the memory storage
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestConfiguration.VALID_CFG_JSON[:-1] + ', "storage": {"backend": "memory"}, "workers": 2}')
+            cfg_json.flush()
+            with self.assertRaises(ConfigurationError):
+                Configuration(cfg_json.name, logging)
@@ -0,0 +1,266 @@
+import logging
+import os
+import tempfile
+import multiprocessing
+import sqlite3
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import database
+from alerts import Alert, AlertRule, AlertRules
+from configuration import Configuration
+from database import Database
+from payment import Payment
+
+
+class TestDatabase(unittest.TestCase):
+
+    VALID_CFG_JSON = '{"token": "my_bot_token",' \
+                     '"wallets": [{"currency": "Dollar", "symbol": "$"}, {"currency": "Toman", "symbol": "T"}],' \
+                     '"users": [{"name": "Julia", "chat_id": 1234}, {"name": "Jack", "chat_id": 4321}]}'
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        cfg_path = os.path.join(self._directory.name, 'config.json')
+        with open(cfg_path, 'w') as cfg_json:
+            cfg_json.write(TestDatabase.VALID_CFG_JSON)
+        self.config = Configuration(cfg_path, logging)
+        self.database = Database(self.config, os.path.join(self._directory.name, 'db.sq3'))
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    # --------------__init__()--------------
+    def test_init(self):
+        # A process opening the database after the migrations, e.g. a worker, should not run them again
+        self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', '-'))
+        with mock.patch.object(database, 'Migrator') as migrator:
+            opened = Database(self.config, os.path.join(self._directory.name, 'db.sq3'), migrate=False)
+        migrator.assert_not_called()
+        self.assertEqual(('10', 'Julia'), opened.get_balance('Dollar'))
+
+    # --------------write_transaction()--------------
+    def test_write_transaction(self):
+        self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', '-'))
+        self.assertEqual(('10', 'Julia'), self.database.get_balance('Dollar'))
+
+    def test_write_transaction2(self):
+        # The payment of the other user should flip the creditor once it exceeds the balance
+        self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', '-'))
+        self.database.write_transaction(Payment('Jack', '25', 'Dollar', '$', '-'))
+        self.assertEqual(('15', 'Jack'), self.database.get_balance('Dollar'))
+        self.assertIsNone(self.database.get_balance('Toman'))
+
+    # --------------get_payments()--------------
+    def test_get_payments(self):
+        self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', 'first'))
+        self.database.write_transaction(Payment('Jack', '20', 'Toman', 'T', 'second'))
+        payments = self.database.get_payments()
+        self.assertEqual(['first', 'second'], [p.note for p in payments])
+        self.assertEqual(('Jack', '20', 'Toman', 'T'), (payments[1].payer, payments[1].amount, payments[1].wallet,
+                                                           payments[1].wallet_symbol))
+
+    def test_get_payments2(self):
+        # Repeated strings should be shared between the records
+        for _ in range(3):
+            self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', '-'))
+        payments = self.database.get_payments()
+        self.assertIs(payments[0].payer, payments[2].payer)
+        self.assertIs(payments[0].wallet_symbol, payments[2].wallet_symbol)
+
+    # --------------get_last_payments()--------------
+    def test_get_last_payments(self):
+        for i in range(7):
+            self.database.write_transaction(Payment('Julia', str(i), 'Dollar', '$', str(i)))
+        self.assertEqual(['2', '3', '4', '5', '6'], [p.note for p in self.database.get_last_payments(5)])
+
+    # --------------run_recurring()--------------
+    def test_run_recurring(self):
+        start = datetime(2023, 1, 1, 9, 0)
+        schedule = self.database.add_recurring(Payment('Julia', '10', 'Dollar', '$', 'rent'), 'monthly', start)
+        schedule.next_due = datetime(2023, 2, 1, 9, 0)
+        self.assertEqual([], self.database.run_recurring(schedule, start))
+        # The same occurrence should not be written twice
+        self.assertIsNone(self.database.run_recurring(schedule, start))
+        self.assertEqual(('10', 'Julia'), self.database.get_balance('Dollar'))
+        self.assertEqual('2023-01-01 09:00:00', self.database.get_payments()[0].date)
+        self.assertEqual(datetime(2023, 2, 1, 9, 0), self.database.get_recurring()[0].next_due)
+
+    # --------------delete_recurring()--------------
+    def test_delete_recurring(self):
+        schedule = self.database.add_recurring(Payment('Julia', '10', 'Dollar', '$', 'rent'), 'daily', datetime.now())
+        self.assertTrue(self.database.delete_recurring(schedule.id))
+        self.assertFalse(self.database.delete_recurring(schedule.id))
+        self.assertEqual([], self.database.get_recurring())
+
+    # --------------get_balances()--------------
+    def test_get_balances(self):
+        self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', '-'))
+        self.database.write_transaction(Payment('Jack', '20', 'Toman', 'T', '-'))
+        self.assertEqual({'Dollar': (10, 'Julia'), 'Toman': (20, 'Jack')}, self.database.get_balances())
+
+    # --------------get_balance_at()--------------
+    def test_get_balance_at(self):
+        with mock.patch.object(database, 'SNAPSHOT_INTERVAL', 3):
+            for day in range(1, 8):
+                schedule = self.database.add_recurring(Payment('Julia' if day % 2 else 'Jack', str(day), 'Dollar', '$', '-'),
+                                                       'daily', datetime(2023, 1, day))
+                schedule.next_due = datetime(2023, 2, 1)
+                self.database.run_recurring(schedule, datetime(2023, 1, day))
+        # Julia: 1 + 3 + 5 + 7, Jack: 2 + 4 + 6
+        self.assertEqual((2, 'Jack'), self.database.get_balance_at('Dollar', datetime(2023, 1, 4)))
+        self.assertEqual((4, 'Julia'), self.database.get_balance_at('Dollar', datetime(2023, 1, 7)))
+        self.assertEqual((0, 'Julia'), self.database.get_balance_at('Dollar', datetime(2022, 1, 1)))
+        self.assertEqual((0, 'Julia'), self.database.get_balance_at('Toman', datetime(2023, 1, 7)))
+
+    # --------------verify()--------------
+    def test_verify(self):
+        with mock.patch.object(database, 'SNAPSHOT_INTERVAL', 2):
+            for i in range(5):
+                self.database.write_transaction(Payment('Julia' if i % 2 else 'Jack', '10', 'Dollar', '$', '-'))
+                self.database.write_transaction(Payment('Julia', '10', 'Toman', 'T', '-'))
+        self.assertEqual([], self.database.verify())
+
+    def test_verify2(self):
+        # Should report a corrupted balance
+        self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', '-'))
+        with sqlite3.connect(os.path.join(self._directory.name, 'db.sq3')) as connection:
+            connection.execute('UPDATE balances SET balance = 11')
+        self.assertEqual(['Balance of Dollar: stored 11 for Julia, expected 10 for Julia'], self.database.verify())
+
+    # --------------reverse_payment()--------------
+    def test_reverse_payment(self):
+        self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', '-'))
+        self.database.write_transaction(Payment('Jack', '4', 'Dollar', '$', '-'))
+        reversal, alerts = self.database.reverse_payment(1)
+        self.assertEqual([], alerts)
+        self.assertEqual(('-10', 'Julia', 'Reversal of payment 1'), (reversal.amount, reversal.payer, reversal.note))
+        self.assertEqual(('4', 'Jack'), self.database.get_balance('Dollar'))
+        with self.assertRaises(ValueError):
+            self.database.reverse_payment(1)
+        with self.assertRaises(ValueError):
+            self.database.reverse_payment(reversal.id)
+        with self.assertRaises(ValueError):
+            self.database.reverse_payment(100)
+        self.assertEqual([], self.database.verify())
+
+    def test_reverse_payment2(self):
+        # Without an ID, the latest payments which are not reversed should be undone one by one
+        self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', '-'))
+        self.database.write_transaction(Payment('Jack', '4', 'Toman', 'T', '-'))
+        self.assertEqual('Reversal of payment 2', self.database.reverse_payment()[0].note)
+        self.assertEqual('Reversal of payment 1', self.database.reverse_payment()[0].note)
+        with self.assertRaises(ValueError):
+            self.database.reverse_payment()
+        self.assertEqual({'Dollar': (0, 'Julia'), 'Toman': (0, 'Jack')}, self.database.get_balances())
+
+    def test_reverse_payment3(self):
+        # Corrections should keep the running monthly spending up to date
+        self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', '-'))
+        self.database.write_transaction(Payment('Jack', '4', 'Dollar', '$', '-'))
+        self.database.reverse_payment(1)
+        with sqlite3.connect(os.path.join(self._directory.name, 'db.sq3')) as connection:
+            self.assertEqual(4, connection.execute('SELECT amount FROM monthly_spending').fetchone()[0])
+
+    # --------------edit_payment()--------------
+    def test_edit_payment(self):
+        self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', 'dinner'))
+        reversal, payment, _ = self.database.edit_payment(1, '12', None)
+        self.assertEqual(('12', 'dinner'), (payment.amount, payment.note))
+        self.assertEqual(('12', 'Julia'), self.database.get_balance('Dollar'))
+        self.assertEqual([1, reversal.id, payment.id], [p.id for p in self.database.get_audit_trail(1)])
+        with self.assertRaises(ValueError):
+            self.database.edit_payment(1, '13', None)
+        self.assertEqual([], self.database.verify())
+
+    # --------------alerts--------------
+    def test_alerts(self):
+        # Every writer should report the alerts it fired, corrections by their net change
+        self.database._alert_rules = AlertRules([AlertRule('Dollar', 'imbalance', 15),
+                                                 AlertRule('Dollar', 'budget', 25)])
+        self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', '-'))
+        self.assertEqual([Alert(AlertRule('Dollar', 'imbalance', 15), 20)],
+                         self.database.edit_payment(1, '20', None)[2])
+        self.assertEqual([], self.database.edit_payment(3, '22', None)[2])
+        self.assertEqual([], self.database.reverse_payment()[1])
+        schedule = self.database.add_recurring(Payment('Julia', '30', 'Dollar', '$', 'rent'), 'monthly', datetime.now())
+        schedule.next_due = datetime(2100, 1, 1)
+        self.assertEqual([Alert(AlertRule('Dollar', 'imbalance', 15), 30), Alert(AlertRule('Dollar', 'budget', 25), 30)],
+                         self.database.run_recurring(schedule, datetime.now()))
+
+    # --------------archive_payments()--------------
+    def test_archive_payments(self):
+        with mock.patch.object(database, 'SNAPSHOT_INTERVAL', 3):
+            for day in range(1, 11):
+                schedule = self.database.add_recurring(Payment('Julia' if day % 3 else 'Jack', str(day), 'Dollar', '$', '-'),
+                                                       'daily', datetime(2023, 1, day))
+                schedule.next_due = datetime(2023, 2, 1)
+                self.database.run_recurring(schedule, datetime(2023, 1, day))
+        balance_at = self.database.get_balance_at('Dollar', datetime(2023, 1, 8))
+        archive_path = os.path.join(self._directory.name, 'archive.sq3')
+        self.assertEqual(7, self.database.archive_payments(datetime(2023, 1, 8), archive_path, batch_size=2))
+        self.assertEqual(list(range(8, 11)), [p.id for p in self.database.get_payments()])
+        with sqlite3.connect(archive_path) as connection:
+            self.assertEqual(7, connection.execute('SELECT COUNT(*) FROM payments').fetchone()[0])
+        self.assertEqual([], self.database.verify())
+        self.assertEqual(balance_at, self.database.get_balance_at('Dollar', datetime(2023, 1, 8)))
+        self.assertEqual((0, 'Julia'), self.database.get_balance_at('Toman', datetime(2023, 1, 8)))
+        with self.assertRaises(ValueError):
+            self.database.get_balance_at('Dollar', datetime(2023, 1, 5))
+
+    def test_archive_payments2(self):
+        # Should always keep the latest payment
+        self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', '-'))
+        archive_path = os.path.join(self._directory.name, 'archive.sq3')
+        self.assertEqual(0, self.database.archive_payments(datetime.now(), archive_path))
+        self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', '-'))
+        self.assertEqual(1, self.database.archive_payments(datetime(2100, 1, 1), archive_path))
+        self.assertEqual([], self.database.verify())
+
+    # --------------backup()--------------
+    def test_backup(self):
+        self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', '-'))
+        target = os.path.join(self._directory.name, 'backup.sq3')
+        self.database.backup(target, pages=1)
+        self.assertEqual(('10', 'Julia'), Database(self.config, target).get_balance('Dollar'))
+
+    # --------------optimize()--------------
+    def test_optimize(self):
+        self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', '-'))
+        self.database.optimize()
+        self.database.optimize()
+        with sqlite3.connect(os.path.join(self._directory.name, 'db.sq3')) as connection:
+            self.assertEqual(2, connection.execute('PRAGMA auto_vacuum').fetchone()[0])
+        self.assertEqual(('10', 'Julia'), self.database.get_balance('Dollar'))
+
+    # --------------concurrency--------------
+    def test_write_transaction_waits_for_lock(self):
+        # A writer should wait for another process holding the write lock instead of failing
+        locker = sqlite3.connect(os.path.join(self._directory.name, 'db.sq3'), isolation_level=None)
+        locker.execute('BEGIN IMMEDIATE')
+        writer = threading.Thread(target=self.database.write_transaction, args=(Payment('Julia', '10', 'Dollar', '$', '-'),))
+        writer.start()
+        time.sleep(0.2)
+        self.assertIsNone(self.database.get_balance('Dollar'))
+        locker.execute('COMMIT')
+        locker.close()
+        writer.join()
+        self.assertEqual(('10', 'Julia'), self.database.get_balance('Dollar'))
+
+    @unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), 'fork is not available')
+    def test_write_transaction_multiprocess(self):
+        def write(payer):
+            for _ in range(50):
+                self.database.write_transaction(Payment(payer, '1.25', 'Dollar', '$', '-'))
+
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=write, args=(payer,)) for payer in ('Julia', 'Julia', 'Julia', 'Jack')]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(('125', 'Julia'), self.database.get_balance('Dollar'))
+        self.assertEqual([], self.database.verify())
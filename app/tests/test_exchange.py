@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+
+from exchange import CachedExchangeRates, ExchangeRates
+
+
+class TestExchangeRates(unittest.TestCase):
+
+    PAIRS = [('Euro', 'Dollar', 1.25), ('Dollar', 'Toman', 40000.0), ('Pound', 'Euro', 1.2)]
+
+    # --------------get_rate()--------------
+    def test_get_rate(self):
+        rates = ExchangeRates('Euro', self.PAIRS)
+        self.assertAlmostEqual(1.25, rates.get_rate('Euro', 'Dollar'))
+        self.assertAlmostEqual(0.8, rates.get_rate('Dollar', 'Euro'))
+        self.assertAlmostEqual(1.0, rates.get_rate('Toman', 'Toman'))
+
+    def test_get_rate2(self):
+        # Should triangulate the pairs which are not quoted directly
+        rates = ExchangeRates('Euro', self.PAIRS)
+        self.assertAlmostEqual(50000.0, rates.get_rate('Euro', 'Toman'))
+        self.assertAlmostEqual(60000.0, rates.get_rate('Pound', 'Toman'))
+
+    def test_get_rate3(self):
+        rates = ExchangeRates('Euro', self.PAIRS + [('Yen', 'Won', 9.0)])
+        with self.assertRaises(ValueError):
+            rates.get_rate('Euro', 'Yen')
+
+    def test_init(self):
+        with self.assertRaises(ValueError):
+            ExchangeRates('Euro', [('Euro', 'Dollar', 0)])
+
+    # --------------convert_all()--------------
+    def test_convert_all(self):
+        rates = ExchangeRates('Euro', self.PAIRS)
+        self.assertAlmostEqual(10 + 8 - 1, rates.convert_all({'Euro': 10, 'Dollar': 10, 'Toman': -50000}, 'Euro'))
+        with self.assertRaises(ValueError):
+            rates.convert_all({'Euro': 10}, 'Yen')
+
+    # --------------load()--------------
+    def test_load(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as rates_csv:
+            rates_csv.write('from,to,rate\nEuro,Dollar,1.25\nDollar,Toman,40000\n')
+            rates_csv.flush()
+            rates = ExchangeRates.load(rates_csv.name)
+            self.assertEqual('Euro', rates.base)
+            self.assertAlmostEqual(50000.0, rates.get_rate('Euro', 'Toman'))
+
+    def test_load2(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as rates_json:
+            rates_json.write('{"base": "Dollar", "rates": [{"from": "Euro", "to": "Dollar", "rate": 1.25}]}')
+            rates_json.flush()
+            rates = ExchangeRates.load(rates_json.name)
+            self.assertEqual('Dollar', rates.base)
+            self.assertEqual(['Dollar', 'Euro'], rates.get_currencies())
+
+
+class TestCachedExchangeRates(unittest.TestCase):
+
+    def test_get(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'rates.csv')
+            cached = CachedExchangeRates(path)
+            self.assertIsNone(cached.get())
+            with open(path, 'w') as f:
+                f.write('from,to,rate\nEuro,Dollar,1.25\n')
+            rates = cached.get()
+            self.assertIs(rates, cached.get())
+            with open(path, 'w') as f:
+                f.write('from,to,rate\nEuro,Dollar,1.5\n')
+            os.utime(path, ns=(0, 0))
+            self.assertAlmostEqual(1.5, cached.get().get_rate('Euro', 'Dollar'))
@@ -0,0 +1,45 @@
+import logging
+import tempfile
+import unittest
+
+from configuration import Configuration
+from grammar import Grammar
+
+
+class TestGrammar(unittest.TestCase):
+
+    VALID_CFG_JSON = '{"token": "my_bot_token",' \
+                     '"wallets": [{"currency": "Dollar", "symbol": "$"}, {"currency": "Euro", "symbol": "€"}],' \
+                     '"users": [{"name": "Julia", "chat_id": 1234}, {"name": "Jack", "chat_id": 4321}]}'
+
+    def setUp(self):
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            cfg_json.write(TestGrammar.VALID_CFG_JSON)
+            cfg_json.flush()
+            self.grammar = Grammar(Configuration(cfg_json.name, logging))
+
+    # --------------parse_payment()--------------
+    def test_parse_payment(self):
+        payment = self.grammar.parse_payment('/pay 25.50 Euro Julia dinner at the place')
+        self.assertEqual(('Julia', '25.50', 'Euro', '€', 'dinner at the place'),
+                         (payment.payer, payment.amount, payment.wallet, payment.wallet_symbol, payment.note))
+
+    def test_parse_payment2(self):
+        # Should accept symbols, any case, a bot mention and no note
+        payment = self.grammar.parse_payment('/pay@wallet_bot 10 $ jack')
+        self.assertEqual(('Jack', '10', 'Dollar', '-'), (payment.payer, payment.amount, payment.wallet, payment.note))
+        self.assertEqual('Dollar', self.grammar.parse_payment('/pay 10$ Jack').wallet)
+
+    def test_parse_payment3(self):
+        for text in ('/pay 10 Pound Julia', '/pay 10.5 Euro Julia', '/pay ten Euro Julia', '/pay 10 Euro Jill',
+                     '/pay 10 Euro', '/pays 10 Euro Julia'):
+            self.assertIsNone(self.grammar.parse_payment(text), text)
+
+    # --------------keyboard answers--------------
+    def test_patterns(self):
+        self.assertTrue(self.grammar.wallet.match('Euro'))
+        self.assertFalse(self.grammar.wallet.match('euro'))
+        self.assertTrue(self.grammar.payer.match('Jack'))
+        self.assertTrue(self.grammar.amount.match('12.30'))
+        self.assertFalse(self.grammar.amount.match('12x30'))
+        self.assertEqual('42', self.grammar.callback.match('pay:42:yes')['token'])
@@ -0,0 +1,20 @@
+import unittest
+
+from ledger import apply_payment, from_signed, to_signed
+
+
+class TestLedger(unittest.TestCase):
+
+    def test_to_signed(self):
+        self.assertEqual(10, to_signed('Julia', 10, 'Julia'))
+        self.assertEqual(-10, to_signed('Jack', 10, 'Julia'))
+
+    def test_from_signed(self):
+        self.assertEqual((10, 'Julia'), from_signed(10, 'Julia', 'Jack'))
+        self.assertEqual((10, 'Jack'), from_signed(-10, 'Julia', 'Jack'))
+
+    def test_apply_payment(self):
+        # Should match the creditor flip of the balances table
+        signed = apply_payment(0, 'Julia', 10, 'Julia')
+        signed = apply_payment(signed, 'Jack', 25, 'Julia')
+        self.assertEqual((15, 'Jack'), from_signed(signed, 'Julia', 'Jack'))
@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import tempfile
+import timeit
+import unittest
+from datetime import date, datetime
+
+from configuration import Configuration, ConfigurationError
+from localization import Localization, english_words, load_locales, NUMBER_WORDS, to_jalali
+from payment import Payment, PersistedPayment
+
+
+class TestLocalization(unittest.TestCase):
+
+    CFG = {'token': 'my_bot_token',
+           'wallets': [{'currency': 'Dollar', 'symbol': '$'}, {'currency': 'Toman', 'symbol': 'T'}],
+           'users': [{'name': 'Julia', 'chat_id': 1234}, {'name': 'Jack', 'chat_id': 4321, 'language': 'fa'}]}
+
+    # Budget of formatting a payment in the heaviest locale (Jalali date, Persian digits and words), which takes about
+    # 80 µs on a laptop. It is checked with a large margin, so that a slow or busy machine does not fail the test
+    FORMAT_BUDGET_SECONDS = 0.0005
+    FORMAT_BUDGET_MARGIN = 10
+
+    @staticmethod
+    def _localization(cfg, directory=None):
+        with tempfile.NamedTemporaryFile('w') as cfg_json:
+            json.dump(cfg, cfg_json)
+            cfg_json.flush()
+            configuration = Configuration(cfg_json.name, logging)
+        return Localization(configuration, directory) if directory else Localization(configuration)
+
+    # --------------english_words()--------------
+    def test_english_words(self):
+        self.assertEqual('zero', english_words('0'))
+        self.assertEqual('one thousand two hundred fifty', english_words('1250'))
+        self.assertEqual('minus two million forty-two', english_words('-2000042'))
+        with self.assertRaises(ValueError):
+            english_words('12.50')
+
+    def test_number_words(self):
+        self.assertEqual('یک هزار و دویست و پنجاه', NUMBER_WORDS['fa']('1250'))
+
+    # --------------to_jalali()--------------
+    def test_to_jalali(self):
+        self.assertEqual((1402, 1, 1), to_jalali(date(2023, 3, 21)))
+        self.assertEqual((1401, 12, 29), to_jalali(date(2023, 3, 20)))
+        self.assertEqual((1403, 7, 1), to_jalali(date(2024, 9, 22)))
+
+    # --------------load_locales()--------------
+    def test_load_locales(self):
+        # Catalogs should be compiled once, with the English messages as fallback
+        self.assertIs(load_locales(), load_locales())
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'en.json'), 'w') as f:
+                json.dump({'messages': {'hello': 'Hello {name}', 'bye': 'Bye'}}, f)
+            with open(os.path.join(directory, 'xx.json'), 'w') as f:
+                json.dump({'messages': {'hello': 'Hi {name}!'}}, f)
+            locales = load_locales(directory)
+        self.assertEqual('Hi Julia!', locales['xx'].get('hello', name='Julia'))
+        self.assertEqual('Bye', locales['xx'].get('bye'))
+
+    def test_load_locales2(self):
+        # Translations should use the same fields as the English messages
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'en.json'), 'w') as f:
+                json.dump({'messages': {'hello': 'Hello {name}'}}, f)
+            with open(os.path.join(directory, 'xx.json'), 'w') as f:
+                json.dump({'messages': {'hello': 'Hi {user}'}}, f)
+            with self.assertRaises(ValueError):
+                load_locales(directory)
+
+    def test_catalogs(self):
+        # The shipped catalogs should compile and translate every message
+        locales = load_locales()
+        self.assertEqual({'en', 'fa'}, set(locales))
+        self.assertEqual('بله', locales['fa'].get('yes'))
+
+    # --------------Localization--------------
+    def test_get_locale(self):
+        localization = self._localization(self.CFG)
+        self.assertEqual('en', localization.get_locale(1234).language)
+        self.assertEqual('fa', localization.get_locale(4321).language)
+        self.assertEqual(['Yes', 'No', 'بله', 'خیر'], localization.get_confirmations())
+
+    def test_init(self):
+        cfg = dict(self.CFG, users=[{'name': 'Julia', 'chat_id': 1234, 'language': 'xx'},
+                                    {'name': 'Jack', 'chat_id': 4321}])
+        with self.assertRaises(ConfigurationError):
+            self._localization(cfg)
+
+    def test_init2(self):
+        cfg = dict(self.CFG, wallets=[{'currency': 'Dollar', 'symbol': '$', 'words': 'xx'}])
+        with self.assertRaises(ConfigurationError):
+            self._localization(cfg)
+
+    def test_format(self):
+        localization = self._localization(self.CFG)
+        payment = PersistedPayment('Jack', '1250', 'Toman', 'T', '-', '2023-03-21 10:05:00', 7)
+        self.assertEqual('ID: 7\nPayer: Jack\nAmount: 1250 T\nAmount: یک هزار و دویست و پنجاه تومان\nWallet: Toman\n'
+                         'Note: -\nDate: 2023-03-21 10:05:00\n', payment.format(localization.get_locale(1234)))
+        self.assertEqual('شناسه: 7\nپرداخت‌کننده: Jack\nمبلغ: ۱۲۵۰ T\nمبلغ: یک هزار و دویست و پنجاه تومان\n'
+                         'کیف پول: Toman\nیادداشت: -\nتاریخ: ۱۴۰۲-۰۱-۰۱ ۱۰:۰۵:۰۰\n',
+                         payment.format(localization.get_locale(4321)))
+
+    def test_format2(self):
+        # Decimal amounts and wallets without words should not be spelled out
+        locale = self._localization(self.CFG).get_locale(4321)
+        text = Payment('Jack', '12.50', 'Toman', 'T', '-').format(locale)
+        self.assertIn('مبلغ: ۱۲٫۵۰ T', text)
+        self.assertNotIn('تومان', text)
+        self.assertEqual(1, Payment('Jack', '10', 'Dollar', '$', '-').format(locale).count('مبلغ'))
+
+    def test_format_budget(self):
+        locale = self._localization(self.CFG).get_locale(4321)
+        payments = [PersistedPayment('Jack', str(i * 1000), 'Toman', 'T', 'note', '2023-03-21 10:05:00', i)
+                    for i in range(200)]
+        # The best of several runs of all the payments, which leaves out most of the noise of other processes
+        best = min(timeit.repeat(lambda: [payment.format(locale) for payment in payments], number=1, repeat=5))
+        self.assertLess(best / len(payments), self.FORMAT_BUDGET_SECONDS * self.FORMAT_BUDGET_MARGIN)
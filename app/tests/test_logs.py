@@ -0,0 +1,86 @@
+import gzip
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+from logs import JsonFormatter, create_file_handler, setup_logging
+
+
+class TestLogs(unittest.TestCase):
+
+    # --------------JsonFormatter--------------
+    def test_json_formatter(self):
+        record = logging.LogRecord('root', logging.INFO, __file__, 1, 'User %s issued /%s command', ('Julia', 'status'), None)
+        record.user, record.command, record.latency_ms = 'Julia', 'status', 1.5
+        data = json.loads(JsonFormatter().format(record))
+        self.assertEqual('User Julia issued /status command', data['message'])
+        self.assertEqual('INFO', data['level'])
+        self.assertEqual(('Julia', 'status', 1.5), (data['user'], data['command'], data['latency_ms']))
+
+    def test_json_formatter2(self):
+        # Unset structured fields should be omitted
+        record = logging.LogRecord('root', logging.INFO, __file__, 1, 'Started', None, None)
+        self.assertNotIn('user', json.loads(JsonFormatter().format(record)))
+
+    # --------------create_file_handler()--------------
+    def test_create_file_handler(self):
+        # Should rotate by size and gzip the rotated file
+        with tempfile.TemporaryDirectory() as directory:
+            log_path = os.path.join(directory, 'log.txt')
+            handler = create_file_handler(log_path, max_bytes=200, backup_count=2)
+            logger = logging.getLogger('test_create_file_handler')
+            logger.propagate = False
+            logger.addHandler(handler)
+            try:
+                for i in range(10):
+                    logger.warning('message %d', i)
+            finally:
+                logger.removeHandler(handler)
+                handler.close()
+            self.assertTrue(os.path.exists(f'{log_path}.1.gz'))
+            self.assertFalse(os.path.exists(f'{log_path}.3.gz'))
+            with gzip.open(f'{log_path}.1.gz', 'rt') as f:
+                self.assertEqual('WARNING', json.loads(f.readline())['level'])
+
+    # --------------setup_logging()--------------
+    def test_setup_logging(self):
+        root = logging.getLogger()
+        old_handlers, old_level = root.handlers[:], root.level
+        with tempfile.TemporaryDirectory() as directory:
+            log_path = os.path.join(directory, 'log.txt')
+            handler = create_file_handler(log_path, compress=False)
+            listener = setup_logging([handler])
+            try:
+                logging.info('through the queue', extra={'command': 'about'})
+            finally:
+                listener.stop()
+                handler.close()
+                root.handlers[:] = old_handlers
+                root.setLevel(old_level)
+            with open(log_path) as f:
+                self.assertEqual('about', json.loads(f.readline())['command'])
+
+    def test_setup_logging2(self):
+        # The traceback should be kept out of the message through the queue
+        root = logging.getLogger()
+        old_handlers, old_level = root.handlers[:], root.level
+        with tempfile.TemporaryDirectory() as directory:
+            log_path = os.path.join(directory, 'log.txt')
+            handler = create_file_handler(log_path, compress=False)
+            listener = setup_logging([handler])
+            try:
+                try:
+                    raise ValueError('invalid')
+                except ValueError:
+                    logging.exception('Unable to %s', 'write')
+            finally:
+                listener.stop()
+                handler.close()
+                root.handlers[:] = old_handlers
+                root.setLevel(old_level)
+            with open(log_path) as f:
+                data = json.loads(f.readline())
+            self.assertEqual('Unable to write', data['message'])
+            self.assertIn('ValueError: invalid', data['exception'])
@@ -0,0 +1,60 @@
+import logging
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from configuration import Configuration
+from database import Database
+from maintenance import Maintenance
+from payment import Payment
+
+
+class TestMaintenance(unittest.TestCase):
+
+    VALID_CFG_JSON = '{"token": "my_bot_token",' \
+                     '"wallets": [{"currency": "Dollar", "symbol": "$"}],' \
+                     '"users": [{"name": "Julia", "chat_id": 1234}, {"name": "Jack", "chat_id": 4321}]}'
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        cfg_path = os.path.join(self._directory.name, 'config.json')
+        with open(cfg_path, 'w') as cfg_json:
+            cfg_json.write(TestMaintenance.VALID_CFG_JSON)
+        self.config = Configuration(cfg_path, logging)
+        self.database = Database(self.config, os.path.join(self._directory.name, 'db.sq3'))
+        self.backups = os.path.join(self._directory.name, 'backups')
+        self.archive = os.path.join(self._directory.name, 'archive.sq3')
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    # --------------backup()--------------
+    def test_backup(self):
+        # Should keep only the configured number of backups
+        maintenance = Maintenance(self.database, self.backups, self.archive, backups=2)
+        for second in range(3):
+            with mock.patch('maintenance.datetime') as dt:
+                dt.now.return_value = datetime(2023, 1, 1, 0, 0, second)
+                maintenance.backup()
+        self.assertEqual(['db-20230101-000001.sq3', 'db-20230101-000002.sq3'],
+                         [os.path.basename(b) for b in maintenance.get_backups()])
+
+    # --------------run_once()--------------
+    def test_run_once(self):
+        self.database.write_transaction(Payment('Julia', '10', 'Dollar', '$', '-'))
+        self.database.write_transaction(Payment('Jack', '5', 'Dollar', '$', '-'))
+        with mock.patch.object(self.database, 'archive_payments', return_value=0) as archive_payments:
+            Maintenance(self.database, self.backups, self.archive).run_once()
+            archive_payments.assert_not_called()
+            Maintenance(self.database, self.backups, self.archive, archive_after_years=2).run_once()
+            archive_payments.assert_called_once()
+        self.assertEqual(('5', 'Julia'), self.database.get_balance('Dollar'))
+
+    # --------------start()--------------
+    def test_start(self):
+        maintenance = Maintenance(self.database, self.backups, self.archive)
+        maintenance.start()
+        maintenance.stop()
+        self.assertEqual(1, len(maintenance.get_backups()))
@@ -0,0 +1,95 @@
+import logging
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from configuration import Configuration
+from database import Database
+from migrations import MIGRATIONS, Migration, Migrator, rewrite_in_batches
+
+
+class TestMigrations(unittest.TestCase):
+
+    VALID_CFG_JSON = '{"token": "my_bot_token",' \
+                     '"wallets": [{"currency": "Dollar", "symbol": "$"}, {"currency": "Toman", "symbol": "T"}],' \
+                     '"users": [{"name": "Julia", "chat_id": 1234}, {"name": "Jack", "chat_id": 4321}]}'
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        cfg_path = os.path.join(self._directory.name, 'config.json')
+        with open(cfg_path, 'w') as cfg_json:
+            cfg_json.write(TestMigrations.VALID_CFG_JSON)
+        self.config = Configuration(cfg_path, logging)
+        self.database_path = os.path.join(self._directory.name, 'db.sq3')
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _create_legacy_database(self):
+        # Schema and data as written by the versions without migrations
+        with sqlite3.connect(self.database_path) as connection:
+            connection.executescript("""
+                CREATE TABLE "users" ("id" INTEGER, "name" TEXT NOT NULL, PRIMARY KEY("id"));
+                CREATE TABLE "wallets" ("id" INTEGER, "wallet" TEXT NOT NULL, PRIMARY KEY("id"));
+                CREATE TABLE "payments" ("id" INTEGER, "payer_id" INTEGER, "amount" INTEGER NOT NULL,
+                    "wallet_id" INTEGER, "note" TEXT NOT NULL, "dt" TEXT NOT NULL, PRIMARY KEY("id"));
+                CREATE TABLE "balances" ("id" INTEGER, "user_id" INTEGER, "balance" INTEGER, "wallet_id" INTEGER,
+                    PRIMARY KEY("id"));
+                INSERT INTO users (name) VALUES ('Julia'), ('Jack');
+                INSERT INTO wallets (wallet) VALUES ('Dollar'), ('Toman');
+                INSERT INTO payments (payer_id, amount, wallet_id, note, dt) VALUES
+                    (1, 0.1, 1, 'a', '2023-01-01 10:00:00'), (1, 0.2, 1, 'b', '2023-01-02 10:00:00');
+                INSERT INTO balances (user_id, balance, wallet_id) VALUES (1, 0.30000000000000004, 1);
+            """)
+
+    # --------------migrate()--------------
+    def test_migrate(self):
+        reports = Migrator(self.database_path, self.config).migrate()
+        self.assertEqual([m.version for m in MIGRATIONS], [r.version for r in reports])
+        self.assertEqual(MIGRATIONS[-1].version, Migrator(self.database_path, self.config).get_version())
+        # Should be a no-op once up to date
+        self.assertEqual([], Migrator(self.database_path, self.config).migrate())
+
+    def test_migrate2(self):
+        # Should upgrade a legacy database in place, keeping its data
+        self._create_legacy_database()
+        database = Database(self.config, self.database_path)
+        self.assertEqual(['a', 'b'], [p.note for p in database.get_payments()])
+        self.assertEqual(('0.3', 'Julia'), database.get_balance('Dollar'))
+        self.assertEqual([], database.verify())
+        with sqlite3.connect(self.database_path) as connection:
+            self.assertEqual(2, connection.execute('SELECT COUNT(*) FROM users').fetchone()[0])
+            self.assertEqual((1, '2023-01', 0.3), connection.execute('SELECT * FROM monthly_spending').fetchone())
+
+    def test_migrate3(self):
+        # A dry run should report the migrations without applying them
+        self._create_legacy_database()
+        reports = Migrator(self.database_path, self.config).migrate(dry_run=True)
+        self.assertEqual(len(MIGRATIONS), len(reports))
+        self.assertEqual(0, Migrator(self.database_path, self.config).get_version())
+        with sqlite3.connect(self.database_path) as connection:
+            self.assertIsNone(connection.execute("SELECT name FROM sqlite_master WHERE name = 'recurring'").fetchone())
+
+    def test_migrate4(self):
+        # A failing migration should be rolled back without destroying the database
+        self._create_legacy_database()
+
+        def failing(connection, configuration):
+            connection.execute('DELETE FROM payments')
+            raise ValueError('boom')
+
+        migrator = Migrator(self.database_path, self.config, MIGRATIONS[:2] + [Migration(3, 'Failing', failing)])
+        with self.assertRaises(RuntimeError):
+            migrator.migrate()
+        self.assertEqual(2, migrator.get_version())
+        with sqlite3.connect(self.database_path) as connection:
+            self.assertEqual(2, connection.execute('SELECT COUNT(*) FROM payments').fetchone()[0])
+
+    # --------------rewrite_in_batches()--------------
+    def test_rewrite_in_batches(self):
+        with sqlite3.connect(self.database_path) as connection:
+            connection.execute('CREATE TABLE numbers (value INTEGER)')
+            connection.executemany('INSERT INTO numbers VALUES (?)', [(i,) for i in range(25)])
+            rewrite_in_batches(connection, 'numbers', 'value = value * 2', batch_size=4)
+            self.assertEqual(sum(range(25)) * 2, connection.execute('SELECT SUM(value) FROM numbers').fetchone()[0])
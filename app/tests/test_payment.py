@@ -0,0 +1,59 @@
+import json
+import unittest
+from io import StringIO
+
+from payment import Payment, PersistedPayment
+
+
+class TestPayment(unittest.TestCase):
+
+    # --------------format()--------------
+    def test_format(self):
+        payment = Payment('Julia', '25.5', 'Euro', '€', 'dinner')
+        self.assertEqual('Payer: Julia\nAmount: 25.5 €\nWallet: Euro\nNote: dinner\n', payment.format())
+
+    def test_format2(self):
+        # Toman amounts should be spelled out in Persian without a configured locale too
+        payment = Payment('Jack', '1250', 'Toman', 'T', '-')
+        self.assertIn('Amount: یک هزار و دویست و پنجاه تومان\n', payment.format())
+
+    def test_slots(self):
+        # Records should not carry a per-instance __dict__
+        payment = PersistedPayment('Julia', '25.5', 'Euro', '€', 'dinner', '2023-01-01 10:00:00')
+        self.assertFalse(hasattr(payment, '__dict__'))
+        with self.assertRaises(AttributeError):
+            payment.foo = 'bar'
+
+
+class TestPersistedPayment(unittest.TestCase):
+
+    PAYMENTS = [PersistedPayment('Julia', '25.5', 'Euro', '€', 'dinner "out"', '2023-01-01 10:00:00'),
+                PersistedPayment('Jack', '1000.0', 'Toman', 'T', '-', '2023-01-02 11:00:00')]
+
+    @staticmethod
+    def _reference_json(payments):
+        return json.dumps({'payments': [{'payer': p.payer, 'amount': f'{p.amount} {p.wallet_symbol}', 'wallet': p.wallet,
+                                         'note': p.note, 'datetime': p.date} for p in payments]}, indent=4)
+
+    # --------------format()--------------
+    def test_format(self):
+        self.assertEqual('Payer: Julia\nAmount: 25.5 €\nWallet: Euro\nNote: dinner "out"\nDate: 2023-01-01 10:00:00\n',
+                         self.PAYMENTS[0].format())
+
+    # --------------jsonify_all()--------------
+    def test_jsonify_all(self):
+        self.assertEqual(self._reference_json(self.PAYMENTS), PersistedPayment.jsonify_all(self.PAYMENTS))
+
+    def test_jsonify_all2(self):
+        self.assertEqual(self._reference_json([]), PersistedPayment.jsonify_all([]))
+
+    # --------------dump_all()--------------
+    def test_dump_all(self):
+        # Should accept a one-shot iterator
+        buffer = StringIO()
+        PersistedPayment.dump_all(iter(self.PAYMENTS), buffer)
+        self.assertEqual(self.PAYMENTS[1].payer, json.loads(buffer.getvalue())['payments'][1]['payer'])
+
+    def test_format2(self):
+        payment = PersistedPayment('Julia', '25.5', 'Euro', '€', 'dinner', '2023-01-01 10:00:00', 7)
+        self.assertTrue(payment.format().startswith('ID: 7\nPayer: Julia\n'))
@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+
+from ratelimit import Coalescer, RateLimiter, TokenBucket
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    # --------------consume()--------------
+    def test_consume(self):
+        clock = FakeClock()
+        bucket = TokenBucket(10, 2, clock)
+        self.assertIsNone(bucket.consume(6))
+        self.assertIsNone(bucket.consume(4))
+        self.assertEqual(0.5, bucket.consume(1))
+        clock.time = 0.5
+        self.assertIsNone(bucket.consume(1))
+
+    def test_consume2(self):
+        # Should not refill beyond the capacity
+        clock = FakeClock()
+        bucket = TokenBucket(10, 2, clock)
+        clock.time = 100
+        self.assertIsNone(bucket.consume(10))
+        self.assertEqual(0.5, bucket.consume(1))
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    # --------------acquire()--------------
+    def test_acquire(self):
+        # Heavy commands should exhaust the bucket of their user only
+        limiter = RateLimiter(10, 1, {'history': 10, 'status': 0.5}, FakeClock())
+        self.assertIsNone(limiter.acquire(1, 'history'))
+        self.assertEqual(0.5, limiter.acquire(1, 'status'))
+        self.assertEqual(1, limiter.acquire(1, None))
+        self.assertIsNone(limiter.acquire(2, 'history'))
+
+    def test_init(self):
+        with self.assertRaises(ValueError):
+            RateLimiter(5, 1, {'history': 10})
+
+
+class TestCoalescer(unittest.TestCase):
+
+    # --------------run()--------------
+    def test_run(self):
+        # Concurrent calls with the same key should share one run
+        coalescer = Coalescer()
+        runs = []
+
+        async def export():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return len(runs)
+
+        async def main():
+            return await asyncio.gather(*(coalescer.run('history', export) for _ in range(5)),
+                                        coalescer.run('other', export))
+
+        self.assertEqual([2, 2, 2, 2, 2, 2], asyncio.run(main()))
+        self.assertEqual(4, coalescer.coalesced)
+        # A later call should run again
+        self.assertEqual(3, asyncio.run(coalescer.run('history', export)))
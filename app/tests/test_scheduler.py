@@ -0,0 +1,97 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+
+from payment import RecurringPayment
+from scheduler import RETRY_SECONDS, Scheduler, next_occurrence
+
+
+class TestNextOccurrence(unittest.TestCase):
+
+    def test_daily(self):
+        start = datetime(2023, 1, 1, 9, 0)
+        self.assertEqual(datetime(2023, 1, 2, 9, 0), next_occurrence('daily', start, start))
+        self.assertEqual(datetime(2023, 1, 11, 9, 0), next_occurrence('daily', start, datetime(2023, 1, 10, 12, 0)))
+
+    def test_weekly(self):
+        start = datetime(2023, 1, 1, 9, 0)
+        self.assertEqual(datetime(2023, 1, 8, 9, 0), next_occurrence('weekly', start, datetime(2023, 1, 2)))
+        self.assertEqual(start, next_occurrence('weekly', start, datetime(2022, 12, 1)))
+
+    def test_monthly(self):
+        # Should clamp to the end of short months without drifting away from the original day
+        start = datetime(2023, 1, 31, 9, 0)
+        self.assertEqual(datetime(2023, 2, 28, 9, 0), next_occurrence('monthly', start, start))
+        self.assertEqual(datetime(2023, 3, 31, 9, 0), next_occurrence('monthly', start, datetime(2023, 2, 28, 9, 0)))
+        self.assertEqual(datetime(2024, 1, 31, 9, 0), next_occurrence('monthly', start, datetime(2023, 12, 31, 9, 0)))
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            next_occurrence('yearly', datetime(2023, 1, 1), datetime(2023, 1, 1))
+
+
+class TestScheduler(unittest.TestCase):
+
+    NOW = datetime(2023, 1, 10, 12, 0)
+
+    @staticmethod
+    def _schedule(id_, period, start):
+        return RecurringPayment(id_, 'Julia', '10', 'Dollar', '$', '-', period, start, start)
+
+    def _run(self, scheduler):
+        async def run():
+            task = asyncio.create_task(scheduler.run())
+            await asyncio.sleep(0.01)
+            task.cancel()
+        asyncio.run(run())
+
+    def test_run(self):
+        # Should catch up the missed occurrences in order of their due time
+        fired = []
+
+        async def callback(schedule, due):
+            fired.append((schedule.id, due))
+
+        scheduler = Scheduler(callback, now=lambda: self.NOW)
+        scheduler.add(self._schedule(1, 'daily', datetime(2023, 1, 8, 9, 0)))
+        scheduler.add(self._schedule(2, 'weekly', datetime(2023, 1, 9, 9, 0)))
+        scheduler.add(self._schedule(3, 'monthly', datetime(2023, 2, 1, 9, 0)))
+        self._run(scheduler)
+        self.assertEqual([(1, datetime(2023, 1, 8, 9, 0)), (1, datetime(2023, 1, 9, 9, 0)),
+                          (2, datetime(2023, 1, 9, 9, 0)), (1, datetime(2023, 1, 10, 9, 0))], fired)
+
+    def test_run2(self):
+        # A failed occurrence should be retried with a backoff instead of being skipped
+        fired = []
+        now = [self.NOW]
+
+        async def callback(schedule, due):
+            fired.append(due)
+            if len(fired) == 1:
+                raise RuntimeError('Network error')
+
+        scheduler = Scheduler(callback, now=lambda: now[0])
+        schedule = self._schedule(1, 'daily', datetime(2023, 1, 10, 9, 0))
+        scheduler.add(schedule)
+        with self.assertLogs(level='ERROR'):
+            self._run(scheduler)
+        self.assertEqual([datetime(2023, 1, 10, 9, 0)], fired)
+        self.assertEqual(datetime(2023, 1, 10, 9, 0), schedule.next_due)
+        now[0] += timedelta(seconds=RETRY_SECONDS)
+        self._run(scheduler)
+        self.assertEqual([datetime(2023, 1, 10, 9, 0)] * 2, fired)
+        self.assertEqual(datetime(2023, 1, 11, 9, 0), schedule.next_due)
+
+    def test_remove(self):
+        fired = []
+
+        async def callback(schedule, due):
+            fired.append(schedule.id)
+
+        scheduler = Scheduler(callback, now=lambda: self.NOW)
+        scheduler.add(self._schedule(1, 'daily', datetime(2023, 1, 10, 9, 0)))
+        scheduler.add(self._schedule(2, 'daily', datetime(2023, 1, 10, 9, 0)))
+        scheduler.remove(1)
+        self._run(scheduler)
+        self.assertEqual([2], fired)
+        self.assertEqual(1, len(scheduler))
@@ -0,0 +1,40 @@
+import multiprocessing
+import unittest
+
+from sharding import ShardedDispatcher, get_shard
+
+
+def echo(index, updates, results):
+    while (update := updates.get()) is not None:
+        results.put((index, update['chat_id']))
+
+
+class TestShardedDispatcher(unittest.TestCase):
+
+    # --------------get_shard()--------------
+    def test_get_shard(self):
+        self.assertEqual(1, get_shard(4321, 4))
+        self.assertEqual(get_shard(-1234, 3), get_shard(-1234, 3))
+        self.assertIn(get_shard(-1234, 3), range(3))
+        # Known chats should be spread by their index even if their IDs have the same remainder
+        self.assertEqual([0, 1], [get_shard(chat_id, 2, [1234, 4322]) for chat_id in (1234, 4322)])
+        self.assertEqual(1, get_shard(5, 2, [1234, 4322]))
+
+    # --------------forward()--------------
+    def test_forward(self):
+        # Every update of a chat should be handled by the same worker
+        results = multiprocessing.get_context('spawn').Queue()
+        dispatcher = ShardedDispatcher(3, echo, (results,), [4321, 1234])
+        dispatcher.start()
+        chat_ids = [1234, 4321, 1234, 5, 4321, 1234]
+        for chat_id in chat_ids:
+            dispatcher.forward(chat_id, {'chat_id': chat_id})
+        dispatcher.stop()
+        handled = [results.get(timeout=10) for _ in chat_ids]
+        self.assertEqual({(0, 4321), (1, 1234), (get_shard(5, 3), 5)}, set(handled))
+        self.assertEqual(sorted(chat_ids), sorted(chat_id for _, chat_id in handled))
+        self.assertEqual(len(chat_ids), sum(dispatcher.forwarded))
+
+    def test_init(self):
+        with self.assertRaises(ValueError):
+            ShardedDispatcher(0, echo)